@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from measeval import GoldCorpus, align, scoreTable, summarize
+from measeval.synthetic import SyntheticCorpus, writeTsvDir
+from measeval.validation import validateDir
+from measeval.profiling import Profiler, profiled, resetPeak
+
+# Benchmarks the scoring pipeline on synthetic corpora of increasing size.
+# Every stage is timed (wall clock and CPU) and its peak memory recorded, down to
+# the joins inside alignment (see measeval/profiling.py), and the results are
+# written to a JSON file that later runs can be compared against with --baseline.
+# Start up is tracked too: validating alone (-v) must not import pandas or pandasql,
+# and the time spent importing, for -v and for the scorer, is recorded with every run.
+
+parser = argparse.ArgumentParser(description='Benchmarks each scoring stage on synthetic gold and submission corpora')
+parser.add_argument('--sizes', help='Comma separated numbers of paragraphs to benchmark; default is 100,1000.', default='100,1000')
+parser.add_argument('--spans', help='Copies of each paragraph and its annotations per synthetic paragraph; default is 1.', type=int, default=1)
+parser.add_argument('--overlap', help='Share of annotation sets with a shifted, overlapping copy; default is 0.1.', type=float, default=0.1)
+parser.add_argument('--fanout', help='Extra Qualifiers per Quantity; default is 0.', type=int, default=0)
+parser.add_argument('--miss', help='Share of gold spans missing from the submission; default is 0.1.', type=float, default=0.1)
+parser.add_argument('--jitter', help='Share of submission spans with shifted boundaries; default is 0.1.', type=float, default=0.1)
+parser.add_argument('--spurious', help='Spurious submission spans, as a share of gold spans; default is 0.1.', type=float, default=0.1)
+parser.add_argument('--unit-errors', help='Share of submission units that are wrong; default is 0.05.', type=float, default=0.05)
+parser.add_argument('--rel-errors', help='Share of submission relationships that are wrong; default is 0.05.', type=float, default=0.05)
+parser.add_argument('--modes', help='Comma separated modes to summarize; default is overall,class,sub.', default='overall,class,sub')
+parser.add_argument('--seed', help='Random seed; default is 0.', type=int, default=0)
+parser.add_argument('--workdir', help='Directory to write the synthetic corpora to; default is a temporary directory.')
+parser.add_argument('-j', '--jobs', help='Number of worker processes to validate files in; default is 1.', type=int, default=1)
+parser.add_argument('-o', '--out', help='JSON file to write results to; default is bench.json.', default='bench.json')
+parser.add_argument('--baseline', help='Earlier results file to compare against.')
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "measeval-eval.py")
+HEAVY_MODULES = ["numpy", "pandas", "pandasql", "sqlalchemy"]
+
+
+def timed(profiler, stages, name, fn, *args):
+    """ Runs fn(*args) as a stage of profiler, recording its wall and CPU time and peak memory under name """
+    with profiler.stage(name) as record:
+        result = fn(*args)
+    stages[name] = {"wall": record["wall"], "cpu": record["cpu"], "peakMB": record["peakMB"], "peakDeltaMB": record["peakDeltaMB"]}
+    return result
+
+
+def importTimes(command):
+    """ Wall time of running python -X importtime with command, the seconds it spent importing, and the heavy modules it imported """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime"] + command, cwd=os.path.dirname(SCRIPT),
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    total = 0
+    heavy = set()
+    # Lines are "import time: self | cumulative | name", with name indented by nesting
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        if not name.startswith(" "):
+            total += int(fields[1])
+        if name.strip().split(".")[0] in HEAVY_MODULES:
+            heavy.add(name.strip().split(".")[0])
+    return {"wall": wall, "imports": total / 1e6, "heavy": sorted(heavy)}
+
+
+def startup(goldDir, subDir):
+    """ Start up costs, each in a fresh interpreter: validating a submission alone, and importing the scorer """
+    validate = importTimes([SCRIPT, "-v", "-i", "", "-g", goldDir, "-s", subDir])
+    if validate["heavy"]:
+        print("Validating alone imported " + ", ".join(validate["heavy"]))
+    return {"validateOnly": validate, "scorerImport": importTimes(["-c", "import measeval.scoring"])}
+
+
+def benchmark(size, args, workdir):
+    """ Generates a corpus of size paragraphs and times every stage of scoring it """
+    stages = {}
+    profiler = Profiler()
+    corpus = timed(profiler, stages, "generate", SyntheticCorpus, size, args.spans, args.overlap, args.fanout, args.seed)
+    sub = timed(profiler, stages, "perturb", corpus.submission, args.miss, args.jitter, args.spurious, args.unit_errors, args.rel_errors, args.seed + 1)
+    goldDir, subDir = os.path.join(workdir, str(size), "gold"), os.path.join(workdir, str(size), "sub")
+    timed(profiler, stages, "write", lambda: (writeTsvDir(corpus.gold, goldDir), writeTsvDir(sub, subDir)))
+
+    report = timed(profiler, stages, "validate", validateDir, subDir, [], args.jobs)
+    if report.badfiles:
+        raise ValueError("Synthetic submission failed validation: " + str(report.badfiles[:5]))
+    sub = timed(profiler, stages, "decode", report.frame)
+    gold = timed(profiler, stages, "loadGold", GoldCorpus, goldDir)
+    # Every join inside align is recorded as a step of the align stage
+    with profiled(profiler):
+        frames = timed(profiler, stages, "align", align, gold, sub)
+    wrk1score = timed(profiler, stages, "scoreTable", scoreTable, frames, gold.categories)
+    for mode in args.modes.split(","):
+        timed(profiler, stages, "summarize:" + mode, summarize, wrk1score, mode)
+
+    overall = summarize(wrk1score, "overall")
+    steps = [record for record in profiler.report() if record["depth"] > 0]
+    return {"paragraphs": size, "goldRows": len(corpus.gold), "subRows": len(sub), "scoreRows": len(wrk1score),
+            "F1": overall["F1"], "total": sum(stage["wall"] for stage in stages.values()), "stages": stages, "alignSteps": steps,
+            "startup": startup(goldDir, subDir)}
+
+
+def compare(results, baseline):
+    """ Prints the wall time of each stage against a baseline run of the same size """
+    before = dict((run["paragraphs"], run) for run in baseline["results"])
+    for run in results:
+        if run["paragraphs"] not in before:
+            continue
+        old = before[run["paragraphs"]]
+        print("Against baseline, " + str(run["paragraphs"]) + " paragraphs:")
+        for name, stage in run["stages"].items():
+            if name in old["stages"]:
+                ratio = stage["wall"] / old["stages"][name]["wall"] if old["stages"][name]["wall"] > 0 else float("nan")
+                print("  {:<20} {:>9.3f}s  was {:>9.3f}s  ({:.2f}x)".format(name, stage["wall"], old["stages"][name]["wall"], ratio))
+        for name, cost in run["startup"].items():
+            if name in old.get("startup", {}):
+                print("  {:<20} {:>9.3f}s  was {:>9.3f}s  (imports {:.3f}s, was {:.3f}s)".format(
+                    "startup:" + name, cost["wall"], old["startup"][name]["wall"], cost["imports"], old["startup"][name]["imports"]))
+        if old.get("F1") != run["F1"]:
+            print("  F1 changed: " + str(old.get("F1")) + " -> " + str(run["F1"]))
+
+
+def main(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="measeval-bench-")
+    meta = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "peakReset": resetPeak(),
+            "params": dict((k, v) for k, v in vars(args).items() if k not in ["out", "baseline", "workdir"])}
+    results = []
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            run = benchmark(size, args, workdir)
+            results.append(run)
+            print(str(size) + " paragraphs, " + str(run["goldRows"]) + " gold rows: " + "{:.3f}s".format(run["total"]))
+            for name, stage in run["stages"].items():
+                print("  {:<20} {:>9.3f}s wall {:>9.3f}s cpu {:>9.1f}MB peak".format(name, stage["wall"], stage["cpu"], stage["peakMB"]))
+            for name, cost in run["startup"].items():
+                print("  {:<20} {:>9.3f}s wall {:>9.3f}s importing".format("startup:" + name, cost["wall"], cost["imports"]))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,29 @@
+import importlib
+
+# The public names of the package, and the module each one lives in.
+# Modules are only imported when one of their names is first used, so that
+# e.g. measeval.validation can be used without importing pandas or pandasql.
+EXPORTS = {
+    "GoldCorpus": "corpus", "readTsvDir": "corpus", "loadTsvDir": "corpus", "loadGold": "corpus",
+    "buildGold": "corpus", "decodeOther": "corpus",
+    "GoldCache": "cache", "goldChecksum": "cache",
+    "align": "scoring", "scoreTable": "scoring", "score": "scoring",
+    "ScoreStore": "incremental", "ErrorStore": "analysis",
+    "scoreRuns": "leaderboard", "writeLeaderboard": "leaderboard",
+    "bratToTsvDir": "brat", "tsvToBratDir": "brat",
+    "summarize": "report", "summarizeAll": "report", "writeBreakdowns": "report", "printSummary": "report", "MODES": "report",
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module 'measeval' has no attribute " + repr(name))
+    value = getattr(importlib.import_module("." + EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
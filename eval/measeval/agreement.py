@@ -0,0 +1,106 @@
+import os
+import json
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from .brat import loadBratDir
+from .corpus import GoldCorpus, CATEGORIES_FILE, readCategories
+from .report import CLASSES, groupScores, jsonSafe
+from .scoring import score
+from .validation import validateDir
+
+# Inter-annotator agreement, measured with the scorer itself.
+# For each pair of annotators, the first takes the place of gold and the second of
+# the submission, limited to the paragraphs both of them annotated, so annotations are
+# aligned with the same quantity anchored matching as submissions are. Rows only one
+# annotator has are disagreements: per class they give class agreement, and per
+# paragraph the hotspots to adjudicate first.
+# Each annotator is prepared as a GoldCorpus once, however many pairs it is in, and
+# pairs are scored in worker processes that share those corpora the way the
+# leaderboard shares gold: inherited where processes are forked, otherwise pickled
+# once per worker.
+
+COUNT_COLUMNS = ["tp", "fp", "fn", "precision", "recall", "fmeasure", "EM", "F1"]
+
+# The annotators the pairs in this process are scored between, as name: (paragraphs, corpus, frame)
+ANNOTATORS = {}
+
+
+def shareAnnotators(annotators):
+    """ Makes annotators the ones pairs in this process are scored between """
+    ANNOTATORS.clear()
+    ANNOTATORS.update(annotators)
+
+
+def loadAnnotations(path, textDir=None, jobs=1):
+    """ One annotator's annotations, from BRAT (.ann) or .tsv files, as names, frame, and problems found """
+    if any(fn.endswith(".ann") for fn in os.listdir(path)):
+        return loadBratDir(path, textDir, jobs)
+    report = validateDir(path, jobs=jobs)
+    bad = set(report.badfiles)
+    return [name for name in report.names if name not in bad], report.frame(), report.errors
+
+
+def pairAgreement(a, b):
+    """ Agreement of annotator b with annotator a, over the paragraphs both annotated (even if one of them found nothing) """
+    paragraphsA, corpus, _ = ANNOTATORS[a]
+    paragraphsB, _, frame = ANNOTATORS[b]
+    docIds = sorted(set(paragraphsA) & set(paragraphsB))
+    results = score(corpus, frame[frame["docId"].isin(docIds)], modes=["overall", "class"], docIds=docIds)
+    documents = dict((key[0], value) for key, value in groupScores(results["table"], ["docId"]).items())
+    return {"paragraphs": len(docIds), "overall": results["overall"], "class": results["class"], "documents": documents}
+
+
+def agreement(annotations, jobs=1, categories=CATEGORIES_FILE):
+    """ Pairwise agreement between annotators, given as name: (file names, annotation frame), in up to jobs worker processes
+
+    Returns frames of the overall agreement of every pair, its agreement per
+    class, and its counts and averages per paragraph.
+    """
+    categories = readCategories(categories) if isinstance(categories, str) else categories
+    shareAnnotators(dict((name, ([fn[:-4] for fn in files], GoldCorpus.fromFrame(frame, categories), frame))
+                         for name, (files, frame) in annotations.items()))
+    pairs = list(itertools.combinations(annotations, 2))
+    if jobs > 1 and len(pairs) > 1:
+        workers = min(jobs, len(pairs))
+        if "fork" in multiprocessing.get_all_start_methods():
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=shareAnnotators, initargs=(dict(ANNOTATORS),))
+        with pool:
+            results = list(pool.map(pairAgreement, [a for a, _ in pairs], [b for _, b in pairs]))
+    else:
+        results = [pairAgreement(a, b) for a, b in pairs]
+
+    overall, classes, documents = [], [], []
+    for (a, b), result in zip(pairs, results):
+        overall.append(dict({"a": a, "b": b, "paragraphs": result["paragraphs"]}, **result["overall"]))
+        classes.extend(dict({"a": a, "b": b, "type": annotType}, **result["class"][annotType]) for annotType in CLASSES)
+        documents.extend(dict({"a": a, "b": b, "docId": docId}, **scores) for docId, scores in result["documents"].items())
+    tables = {"pairs": pd.DataFrame(overall, columns=["a", "b", "paragraphs"] + COUNT_COLUMNS),
+              "classes": pd.DataFrame(classes, columns=["a", "b", "type"] + COUNT_COLUMNS),
+              "documents": pd.DataFrame(documents, columns=["a", "b", "docId"] + COUNT_COLUMNS)}
+    tables["documents"]["disagreements"] = tables["documents"]["fp"] + tables["documents"]["fn"]
+    return tables
+
+
+def classAgreement(classes):
+    """ Agreement per class over every pair: summed counts, and F-measure, EM, and F1 (Overlap) averaged over pairs """
+    grouped = classes.groupby("type", sort=False)
+    table = grouped[["tp", "fp", "fn"]].sum().join(grouped[["fmeasure", "EM", "F1"]].mean())
+    return table.reindex(CLASSES)
+
+
+def hotspots(documents, top=10):
+    """ The paragraphs annotators disagree on most, over every pair: most disagreements first, then lowest F1 (Overlap) """
+    grouped = documents.groupby("docId", sort=False)
+    table = grouped[["disagreements", "tp"]].sum().join(grouped[["EM", "F1"]].mean()).join(grouped.size().rename("pairs"))
+    return table.sort_values(["disagreements", "F1"], ascending=[False, True], kind="stable").head(top)
+
+
+def writeAgreement(tables, path):
+    """ Writes every agreement table to path as json """
+    with open(path, "w") as f:
+        json.dump(dict((name, [jsonSafe(row) for row in table.to_dict(orient="records")]) for name, table in tables.items()), f, indent=2)
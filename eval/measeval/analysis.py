@@ -0,0 +1,214 @@
+import re
+import json
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from .intervals import keyCodes
+from .report import MATCH_TYPES
+
+# Error analysis.
+# Every row of the score table comes from one row of one of the frames align builds,
+# and those rows say which submission and gold annotations the row is about. With
+# score(..., details=True) they are kept as detail rows next to the score table: the
+# frame the row came from (its source), the annotSet and annotId on each side, offsets
+# and text of both spans, the unit, modifier, or relationship target where the frame
+# is about one, and the F1 of the pair itself (the score table has the best F1 of
+# each submission Quantity instead).
+# An ErrorStore keeps the detail rows of any number of runs in one SQLite file,
+# indexed on docId, type, matchType, and subject, so questions like "every gold only
+# MeasuredProperty in Biology" are answered from the index rather than by scoring again.
+
+DETAIL_COLUMNS = ["source", "annotSet", "annotId", "subStart", "subEnd", "subText", "subValue",
+                  "gAnnotSet", "gAnnotId", "goldStart", "goldEnd", "goldText", "goldValue", "pairF1"]
+INT_COLUMNS = ["annotSet", "subStart", "subEnd", "gAnnotSet", "goldStart", "goldEnd"]
+TEXT_COLUMNS = ["source", "annotId", "subText", "subValue", "gAnnotId", "goldText", "goldValue"]
+
+# Where each side's annotation is found in the different kinds of frames, as
+# frame column: detail column. Relationship rows are about their source spans.
+SUB_SPAN = {"annotSet": "annotSet", "annotId": "annotId", "startOffset": "subStart", "endOffset": "subEnd", "text": "subText"}
+GOLD_SPAN = {"annotSet": "gAnnotSet", "annotId": "gAnnotId", "startOffset": "goldStart", "endOffset": "goldEnd", "text": "goldText"}
+COLUMN_MAPS = {
+    "match": {"annotSet": "annotSet", "annotId": "annotId", "aStart": "subStart", "aEnd": "subEnd", "aText": "subText",
+              "gAnnotSet": "gAnnotSet", "gAnnotId": "gAnnotId", "gStart": "goldStart", "gEnd": "goldEnd", "gText": "goldText"},
+    "subOnly": SUB_SPAN,
+    "goldOnly": GOLD_SPAN,
+    "unitMatch": {"annotSet": "annotSet", "annotId": "annotId", "startOffset": "subStart", "endOffset": "subEnd", "sText": "subText", "sUnit": "subValue",
+                  "gAnnotSet": "gAnnotSet", "gAnnotId": "gAnnotId", "gText": "goldText", "gUnit": "goldValue"},
+    "subOnlyUnit": dict(SUB_SPAN, unit="subValue"),
+    "goldOnlyUnit": dict(GOLD_SPAN, unit="goldValue"),
+    "modsMatch": {"annotSet": "annotSet", "annotId": "annotId", "startOffset": "subStart", "endOffset": "subEnd", "sText": "subText", "sMods": "subValue",
+                  "gAnnotSet": "gAnnotSet", "gAnnotId": "gAnnotId", "gText": "goldText", "gMods": "goldValue"},
+    "subOnlyMods": dict(SUB_SPAN, mods="subValue"),
+    "goldOnlyMods": dict(GOLD_SPAN, mods="goldValue"),
+    "relMatch": {"annotSet": "annotSet", "src": "annotId", "target": "subValue", "gAnnotSet": "gAnnotSet", "gSrc": "gAnnotId", "gTarget": "goldValue"},
+    "relSubOnly": {"annotSet": "annotSet", "src": "annotId", "target": "subValue"},
+    "relGoldOnly": {"annotSet": "gAnnotSet", "src": "gAnnotId", "target": "goldValue"},
+}
+
+# The kind of each frame in SCORE_FRAMES
+FRAME_KINDS = {
+    "quantityMatches": "match", "subOnlyQuants": "subOnlyUnit", "goldOnlyQuants": "goldOnlyUnit",
+    "unitMatches": "unitMatch", "subOnlyUnits": "subOnlyUnit", "goldOnlyUnits": "goldOnlyUnit",
+    "entityMatches": "match", "subOnlyEntities": "subOnly", "goldOnlyEntities": "goldOnly",
+    "propertyMatches": "match", "subOnlyProperties": "subOnly", "goldOnlyProperties": "goldOnly",
+    "qualifierMatches": "match", "subOnlyQualifiers": "subOnly", "goldOnlyQualifiers": "goldOnly",
+    "hasQuantMatch": "relMatch", "subOnlyHasQuant": "relSubOnly", "goldOnlyHasQuant": "relGoldOnly",
+    "hasPropMatch": "relMatch", "subOnlyHasProp": "relSubOnly", "goldOnlyHasProp": "relGoldOnly",
+    "qualifiesMatch": "relMatch", "subOnlyQualifies": "relSubOnly", "goldOnlyQualifies": "relGoldOnly",
+    "modsMatches": "modsMatch", "subOnlyMods": "subOnlyMods", "goldOnlyMods": "goldOnlyMods",
+}
+
+
+def frameDetails(name, frame):
+    """ The detail columns of one alignment frame, with its docId for looking up spans """
+    part = pd.DataFrame({"docId": frame["docId"].to_numpy(dtype=object)})
+    for src, dst in COLUMN_MAPS[FRAME_KINDS[name]].items():
+        part[dst] = frame[src].to_numpy(dtype=object)
+    part["source"] = name
+    part["pairF1"] = pd.to_numeric(frame["F1"], errors="coerce").to_numpy(dtype=np.float64)
+    return part
+
+
+def fillSpans(rows, frame, idColumns, spanColumns):
+    """ Fills in the spans of rows that only name their annotation, from the frame rows (docId, annotSet, annotId) they name """
+    missing = np.flatnonzero(rows[spanColumns[0]].isna().to_numpy() & rows[idColumns[-1]].notna().to_numpy())
+    if len(missing) == 0 or len(frame) == 0:
+        return
+    lKeys, rKeys = keyCodes(rows.iloc[missing], frame, ["docId"] + idColumns, ["docId", "annotSet", "annotId"])
+    # Of annotations with the same ids, the first is the one used
+    keys, first = np.unique(rKeys, return_index=True)
+    keep = keys >= 0
+    found = pd.Index(keys[keep]).get_indexer(lKeys)
+    hit = (lKeys >= 0) & (found >= 0)
+    positions = first[keep][found[hit]]
+    for src, dst in zip(["startOffset", "endOffset", "text"], spanColumns):
+        values = rows[dst].to_numpy(dtype=object, copy=True)
+        values[missing[hit]] = frame[src].to_numpy(dtype=object)[positions]
+        rows[dst] = values
+
+
+def detailRows(frames, gold, sub):
+    """ One detail row (see DETAIL_COLUMNS) per row of the score table built from the frames align returned """
+    from .scoring import SCORE_FRAMES
+    rows = pd.concat([frameDetails(name, frames[name]) for name, _, _ in SCORE_FRAMES], ignore_index=True)
+    rows = rows.reindex(columns=["docId"] + DETAIL_COLUMNS)
+    for col in ["annotSet", "gAnnotSet"]:
+        rows[col] = pd.to_numeric(rows[col], errors="coerce")
+    # Rows about relationships, units, and modifiers only name some of their spans
+    fillSpans(rows, sub, ["annotSet", "annotId"], ["subStart", "subEnd", "subText"])
+    fillSpans(rows, gold.frame, ["gAnnotSet", "gAnnotId"], ["goldStart", "goldEnd", "goldText"])
+    for col in INT_COLUMNS:
+        rows[col] = pd.to_numeric(rows[col], errors="coerce").astype("Int64")
+    # Text columns stay object even where a shard has none of their values
+    for col in TEXT_COLUMNS:
+        rows[col] = rows[col].astype(object)
+    return rows.drop(columns=["docId"])
+
+
+def addContext(details, texts, window=60):
+    """ Details with the text around both spans of each row, window characters either side, as context """
+    starts = details[["subStart", "goldStart"]].min(axis=1).to_numpy()
+    ends = details[["subEnd", "goldEnd"]].max(axis=1).to_numpy()
+    context = np.full(len(details), None, dtype=object)
+    for i, docId in enumerate(details["docId"].to_numpy(dtype=object)):
+        text = texts.get(docId)
+        if text is None or pd.isna(starts[i]):
+            continue
+        start, end = max(int(starts[i]) - window, 0), int(ends[i]) + window
+        context[i] = " ".join(text[start:end].split())
+    return details.assign(context=context)
+
+
+# Each run's rows replace the ones it had before; runs table records how each run was scored
+STORE_VERSION = 1
+STORE_COLUMNS = ["run", "docId", "subject", "type", "matchType", "EM", "F1"] + DETAIL_COLUMNS + ["context"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, rows INTEGER, settings TEXT, written REAL);
+CREATE TABLE IF NOT EXISTS rows (
+    run TEXT, docId TEXT, subject TEXT, type TEXT, matchType TEXT, EM REAL, F1 REAL,
+    source TEXT, annotSet INTEGER, annotId TEXT, subStart INTEGER, subEnd INTEGER, subText TEXT, subValue TEXT,
+    gAnnotSet INTEGER, gAnnotId TEXT, goldStart INTEGER, goldEnd INTEGER, goldText TEXT, goldValue TEXT,
+    pairF1 REAL, context TEXT);
+CREATE INDEX IF NOT EXISTS rowsByType ON rows (matchType, type, subject, run);
+CREATE INDEX IF NOT EXISTS rowsByDoc ON rows (docId, run);
+CREATE INDEX IF NOT EXISTS rowsByRun ON rows (run);
+"""
+# The columns queries can filter on
+FILTERS = ["run", "docId", "subject", "type", "matchType", "source"]
+MATCH_ALIASES = dict((re.sub("[^a-z]", "", m.lower()), m) for m in MATCH_TYPES)
+
+
+def canonicalMatchType(matchType):
+    """ Maps a match type, or a spelling of one such as gold-only or goldOnly, onto one of MATCH_TYPES """
+    key = re.sub("[^a-z]", "", matchType.lower())
+    if key not in MATCH_ALIASES:
+        raise ValueError("Unknown match type {!r}; expected one of {}".format(matchType, ", ".join(MATCH_TYPES)))
+    return MATCH_ALIASES[key]
+
+
+class ErrorStore(object):
+    """ Detail rows of scored runs, in an indexed SQLite file """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, STORE_VERSION):
+            raise ValueError(path + " is an error store of version " + str(version) + ", not " + str(STORE_VERSION))
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("PRAGMA user_version = " + str(STORE_VERSION))
+
+    def close(self):
+        self.connection.close()
+
+    def write(self, run, details, settings=None):
+        """ Replaces the rows of a run with details (a score table with detail rows, see score), returning the row count """
+        frame = details.reindex(columns=STORE_COLUMNS[1:]).astype(object)
+        frame = frame.where(frame.notna(), None)
+        values = [(run,) + row for row in frame.itertuples(index=False, name=None)]
+        insert = "INSERT INTO rows VALUES (" + ", ".join("?" * len(STORE_COLUMNS)) + ")"
+        with self.connection:
+            self.connection.execute("DELETE FROM rows WHERE run = ?", (run,))
+            self.connection.executemany(insert, values)
+            self.connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+                                    (run, len(values), json.dumps(settings or {}, sort_keys=True), time.time()))
+        return len(values)
+
+    def runs(self):
+        """ Every run in the store, with its row count, scoring settings, and when it was written """
+        return pd.read_sql_query("SELECT run, rows, settings, datetime(written, 'unixepoch') AS written FROM runs ORDER BY run", self.connection)
+
+    def where(self, filters):
+        """ The WHERE clause and its parameters for filters of column: value or list of values """
+        clauses, params = [], []
+        for col, value in filters.items():
+            if col not in FILTERS:
+                raise ValueError("Can't filter on {!r}; expected one of {}".format(col, ", ".join(FILTERS)))
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            if col == "matchType":
+                values = [canonicalMatchType(v) for v in values]
+            clauses.append(col + " IN (" + ", ".join("?" * len(values)) + ")")
+            params += values
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, limit=None, **filters):
+        """ Rows matching every filter (column=value or list of values, see FILTERS), in the order they were written """
+        where, params = self.where(filters)
+        sql = "SELECT * FROM rows" + where + " ORDER BY rowid"
+        if limit is not None:
+            sql += " LIMIT " + str(int(limit))
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def counts(self, by=("run", "type", "matchType"), **filters):
+        """ Number of rows matching every filter, per combination of the by columns """
+        for col in by:
+            if col not in FILTERS:
+                raise ValueError("Can't count by {!r}; expected any of {}".format(col, ", ".join(FILTERS)))
+        where, params = self.where(filters)
+        cols = ", ".join(by)
+        sql = "SELECT " + cols + ", COUNT(*) AS rows FROM rows" + where + " GROUP BY " + cols + " ORDER BY " + cols
+        return pd.read_sql_query(sql, self.connection, params=params)
@@ -0,0 +1,369 @@
+import os
+import json
+import shutil
+
+from .validation import COLUMNS, ValidationError, readRaw, checkColumns
+
+# Conversion between BRAT standoff annotations and the MeasEval .tsv format.
+# In BRAT every annotation set of a paragraph is its own pair of files,
+# <docId>-<annotSet>.ann and <docId>-<annotSet>.txt, and every .txt is a full copy
+# of the paragraph text. In the .tsv format a paragraph is one file, with a row per
+# span and the unit, modifiers, and relationships in the json "other" column:
+# - T lines are spans. Unit spans become the "unit" of the Quantity of their set
+#   (there is one per set in the MeasEval data) and are not rows of their own.
+#   Discontinuous spans become the one span covering all their fragments.
+# - A lines are modifiers of a Quantity: IsApproximate and IsCount are binary
+#   attributes, the others values of a QuantityQualifier attribute.
+# - R lines are relationships, keyed on their first argument.
+# - annotIds are the BRAT ids with the annotation set appended, e.g. T1-3.
+# Rows are written Quantity first, then MeasuredProperty, MeasuredEntity, and
+# Qualifier, each in the order of the .ann file, as in the MeasEval data.
+# Each paragraph's text is read once, from a directory with one <docId>.txt per
+# paragraph (data/*/text), or else from the first of its BRAT copies. Going the other
+# way, every .txt written is a link to that one file rather than another copy.
+# Every span is checked against the text at its offsets while converting, and rows
+# against the validation rules as well; a paragraph with any problem is reported
+# and not written. loadBratDir reads BRAT annotations straight into an annotation
+# frame for scoring, without writing .tsv files.
+
+TYPE_ORDER = ["Quantity", "MeasuredProperty", "MeasuredEntity", "Qualifier"]
+RELATIONS = ["HasQuantity", "HasProperty", "Qualifies"]
+BINARY_MODS = ["IsApproximate", "IsCount"]
+LINKS = ["hard", "symbolic", "copy"]
+
+
+def readText(path):
+    """ The text of a paragraph, as BRAT offsets count it """
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def readAnn(path):
+    """ The spans, attributes, and relationships of a BRAT .ann file, with their line numbers """
+    spans, attributes, relations = [], [], []
+    with open(path, encoding="utf-8", newline="") as f:
+        lines = f.read().split("\n")
+    for line, content in enumerate(lines, 1):
+        fields = content.rstrip("\r").split("\t")
+        if fields[0].startswith("T") and len(fields) >= 3:
+            spans.append((line, fields[0], fields[1], fields[2]))
+        elif fields[0].startswith("A") and len(fields) >= 2:
+            attributes.append((line, fields[1].split(" ")))
+        elif fields[0].startswith("R") and len(fields) >= 2:
+            relations.append((line, fields[1].split(" ")))
+    return spans, attributes, relations
+
+
+def annRows(path, docId, annotSet, text, errors):
+    """ The .tsv rows of one BRAT annotation set, adding any problems found to errors """
+    fn = os.path.basename(path)
+    spans, attributes, relations = readAnn(path)
+    suffix = "-" + str(annotSet)
+    entities = []
+    for line, annotId, location, spanText in spans:
+        annotType, _, offsets = location.partition(" ")
+        fragments = [fragment.split(" ") for fragment in offsets.split(";")]
+        if not all(len(fragment) == 2 and fragment[0].isdigit() and fragment[1].isdigit() for fragment in fragments):
+            errors.append(ValidationError(fn, line, "offsets", "span", location, "'{}' is not a type with start and end offsets".format(location)))
+            continue
+        if annotType not in TYPE_ORDER + ["Unit"]:
+            errors.append(ValidationError(fn, line, "annotType", "set", annotType, "'{}' is not one of {}".format(annotType, ", ".join(TYPE_ORDER + ["Unit"]))))
+            continue
+        fragments = [(int(s), int(e)) for s, e in fragments]
+        start, end = fragments[0][0], fragments[-1][1]
+        # BRAT gives the text of a discontinuous span as its fragments joined by spaces;
+        # the .tsv format has no such spans, so it becomes the span covering them all
+        if " ".join(text[s:e] for s, e in fragments) != spanText:
+            errors.append(offsetError(fn, line, spanText, text, start, end))
+        entities.append((annotId, annotType, start, end, text[start:end]))
+
+    ids = set(annotId for annotId, _, _, _, _ in entities)
+    other = dict((annotId, {}) for annotId in ids)
+    for line, fields in attributes:
+        # IsCount T1, or QuantityQualifier T1 IsRange
+        annotId, mod = (fields[1], fields[2]) if fields[0] == "QuantityQualifier" and len(fields) == 3 else (fields[-1], fields[0])
+        if annotId not in ids:
+            errors.append(ValidationError(fn, line, "mods", "reference", annotId, "'{}' is not a span of this set".format(annotId)))
+            continue
+        other[annotId].setdefault("mods", []).append(mod)
+
+    # A Unit belongs to the Quantity of its set, or if there are more, the one it is in or nearest to
+    quantities = [(annotId, start, end) for annotId, annotType, start, end, _ in entities if annotType == "Quantity"]
+    for annotId, annotType, start, end, spanText in entities:
+        if annotType == "Unit":
+            if not quantities:
+                errors.append(ValidationError(fn, None, "unit", "reference", spanText, "Unit '{}' in a set without a Quantity".format(spanText)))
+                continue
+            nearest = min(quantities, key=lambda q: (not (q[1] <= start and end <= q[2]), abs(q[1] - start)))
+            other[nearest[0]]["unit"] = spanText
+
+    for line, fields in relations:
+        args = [arg.split(":", 1)[-1] for arg in fields[1:3]]
+        if fields[0] not in RELATIONS or len(args) != 2 or not all(arg in ids for arg in args):
+            errors.append(ValidationError(fn, line, "other", "reference", " ".join(fields), "'{}' is not a relationship between spans of this set".format(" ".join(fields))))
+            continue
+        other[args[0]][fields[0]] = args[1] + suffix
+
+    rows = []
+    for annotId, annotType, start, end, spanText in sorted(entities, key=lambda e: TYPE_ORDER.index(e[1]) if e[1] in TYPE_ORDER else len(TYPE_ORDER)):
+        if annotType == "Unit":
+            continue
+        data = json.dumps(other[annotId], ensure_ascii=False) if other[annotId] else ""
+        rows.append([docId, str(annotSet), annotType, str(start), str(end), annotId + suffix, spanText, data])
+    return rows
+
+
+def offsetError(fn, line, spanText, text, start, end):
+    """ A problem for a span whose text isn't the paragraph text at its offsets """
+    found = text[start:end]
+    if len(found) > len(spanText) + 20:
+        found = found[:len(spanText) + 20] + "..."
+    return ValidationError(fn, line, "text", "offset", spanText, "'{}' is '{}' in the text at {}-{}".format(spanText, found, start, end))
+
+
+def missingText(path):
+    """ A problem for a paragraph text that isn't there, or None if it is """
+    if os.path.isfile(path):
+        return None
+    return ValidationError(os.path.basename(path), None, "text", "missing", None, "No paragraph text at " + path)
+
+
+def bratParagraphs(path):
+    """ The annotation sets of every paragraph in a BRAT directory, as docId: sorted (annotSet, file name without extension) """
+    paragraphs = {}
+    for fn in os.listdir(path):
+        if not fn.endswith(".ann"):
+            continue
+        # docIds are <article>-<paragraph>, so a name with one dash is a paragraph with a single, unnumbered set
+        name = fn[:-4]
+        docId, _, annotSet = name.rpartition("-")
+        if name.count("-") == 1:
+            docId, annotSet = name, "1"
+        if annotSet.isdigit():
+            paragraphs.setdefault(docId, []).append((int(annotSet), name))
+    return dict((docId, sorted(sets)) for docId, sets in sorted(paragraphs.items()))
+
+
+def writeTsv(path, rows):
+    """ Writes .tsv rows the way the MeasEval data is written: tab separated, without quoting """
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(COLUMNS) + "\n")
+        f.writelines("\t".join(row) + "\n" for row in rows)
+
+
+def paragraphRows(docId, sets, src, textDir=None):
+    """ The .tsv rows of one BRAT paragraph and its annotation sets (see bratParagraphs), and the problems found """
+    found = []
+    copies = [os.path.join(src, name + ".txt") for _, name in sets]
+    textPath = os.path.join(textDir, docId + ".txt") if textDir is not None else copies[0]
+    if missingText(textPath) is not None:
+        return [], [missingText(textPath)]
+    text = readText(textPath)
+    if textDir is None:
+        # The other copies are not read, only checked to be the same size as the first
+        size = os.path.getsize(textPath)
+        for copy in copies[1:]:
+            if not os.path.isfile(copy) or os.path.getsize(copy) != size:
+                found.append(ValidationError(os.path.basename(copy), None, "text", "copy", None, "Differs from " + os.path.basename(copies[0])))
+    rows = []
+    for annotSet, name in sets:
+        rows += annRows(os.path.join(src, name + ".ann"), docId, annotSet, text, found)
+    return rows, found
+
+
+def tsvColumns(docId, rows):
+    """ The .tsv rows of one paragraph as the columns validation checks, and the problems it finds in them """
+    # Rows are checked as the lines of the .tsv file they would be written to
+    columns = dict((col, [row[i] for row in rows]) for i, col in enumerate(COLUMNS))
+    columns["file"] = [docId + ".tsv"] * len(rows)
+    columns["line"] = list(range(2, len(rows) + 2))
+    return columns, checkColumns(columns)
+
+
+def bratToTsvFiles(paragraphs, src, out, textDir=None):
+    """ Converts BRAT paragraphs (docId, sets) into one .tsv file each, returning the files written and the problems found """
+    written, errors = [], []
+    for docId, sets in paragraphs:
+        rows, found = paragraphRows(docId, sets, src, textDir)
+        found += tsvColumns(docId, rows)[1]
+        if found:
+            errors += found
+            continue
+        writeTsv(os.path.join(out, docId + ".tsv"), rows)
+        written.append(docId + ".tsv")
+    return written, errors
+
+
+def bratFrameFiles(paragraphs, src, textDir=None):
+    """ Reads BRAT paragraphs (docId, sets) into the typed frame their .tsv files would give, returning the .tsv names, problems, and frame """
+    from .validation import typedFrame
+    import pandas as pd
+    names, errors = [], []
+    columns = dict((col, []) for col in COLUMNS + ["file", "line"])
+    for docId, sets in paragraphs:
+        rows, found = paragraphRows(docId, sets, src, textDir)
+        check, problems = tsvColumns(docId, rows)
+        found += problems
+        if found:
+            errors += found
+            continue
+        names.append(docId + ".tsv")
+        for col in check:
+            columns[col].extend(check[col])
+    return names, errors, typedFrame(pd.DataFrame(columns, dtype=object))
+
+
+def linkText(source, target, links):
+    """ Makes target a hard link, symbolic link, or copy of source, falling back to the next of these where one isn't possible """
+    if os.path.lexists(target):
+        os.remove(target)
+    for kind in LINKS[LINKS.index(links):]:
+        try:
+            if kind == "hard":
+                os.link(source, target)
+            elif kind == "symbolic":
+                os.symlink(os.path.abspath(source), target)
+            else:
+                shutil.copyfile(source, target)
+            return kind
+        except OSError:
+            if kind == "copy":
+                raise
+
+
+def annLines(rows, text, fn, errors):
+    """ The lines of a BRAT .ann file for the raw .tsv rows of one annotation set, adding any problems found to errors """
+    annotSet = rows[0][1][1]
+    suffix = "-" + annotSet
+    ids = dict((annotId, annotId[:-len(suffix)] if annotId.endswith(suffix) else annotId) for _, (_, _, _, _, _, annotId, _, _) in rows)
+    ids = dict((annotId, bratId if bratId.startswith("T") else "T" + bratId) for annotId, bratId in ids.items())
+    if len(set(ids.values())) != len(ids):
+        errors.append(ValidationError(fn, rows[0][0], "annotId", "unique", annotSet, "annotIds of set {} are not unique without the set".format(annotSet)))
+    spans, attributes, relations = [], [], []
+    free = 1 + max([int(bratId[1:]) for bratId in ids.values() if bratId[1:].isdigit()] + [0])
+    for line, (_, _, annotType, start, end, annotId, spanText, other) in rows:
+        start, end = int(start), int(end)
+        if text[start:end] != spanText:
+            errors.append(offsetError(fn, line, spanText, text, start, end))
+        spans.append("{}\t{} {} {}\t{}".format(ids[annotId], annotType, start, end, spanText))
+        data = json.loads(other) if other else {}
+        for mod in data.get("mods", []):
+            attribute = mod + " " + ids[annotId] if mod in BINARY_MODS else "QuantityQualifier " + ids[annotId] + " " + mod
+            attributes.append("A{}\t{}".format(len(attributes) + 1, attribute))
+        for relation in RELATIONS:
+            if relation in data:
+                if data[relation] not in ids:
+                    errors.append(ValidationError(fn, line, "other", "reference", data[relation], "'{}' is not an annotId of set {}".format(data[relation], annotSet)))
+                    continue
+                relations.append("R{}\t{} Arg1:{} Arg2:{}".format(len(relations) + 1, relation, ids[annotId], ids[data[relation]]))
+        if "unit" in data:
+            # Only the unit's text is kept in the .tsv format, so it is placed within
+            # the Quantity if it is there, and otherwise as close to it as it occurs
+            unit = data["unit"]
+            at = spanText.rfind(unit)
+            if at >= 0:
+                at += start
+            else:
+                before, after = text.rfind(unit, 0, start + len(unit) - 1), text.find(unit, start)
+                at = min([a for a in [before, after] if a >= 0], key=lambda a: abs(a - start), default=-1)
+            if at < 0 or not unit:
+                errors.append(ValidationError(fn, line, "other", "unit", unit, "unit '{}' does not occur in the text".format(unit)))
+                continue
+            spans.append("T{}\tUnit {} {}\t{}".format(free, at, at + len(unit), unit))
+            free += 1
+    return spans + attributes + relations
+
+
+def tsvToBratFiles(names, src, out, textDir, links="hard"):
+    """ Converts .tsv files into BRAT annotation sets, returning the files written and the problems found """
+    written, errors = [], []
+    for fn in names:
+        docId = fn[:-4]
+        header, rows, lines = readRaw(os.path.join(src, fn))
+        if header != COLUMNS:
+            errors.append(ValidationError(fn, 1, None, "header", None, "Expected the fields {}".format(COLUMNS)))
+            continue
+        textPath = os.path.join(textDir, docId + ".txt")
+        if missingText(textPath) is not None:
+            errors.append(missingText(textPath))
+            continue
+        text = readText(textPath)
+        # Only rows that pass validation can be converted
+        found = [ValidationError(fn, line, None, "fields", None, "Expected {} fields, got {}".format(len(COLUMNS), len(row)))
+                 for line, row in zip(lines, rows) if len(row) != len(COLUMNS)]
+        columns = dict((col, [row[i] for row in rows if len(row) == len(COLUMNS)]) for i, col in enumerate(COLUMNS))
+        columns["file"] = [fn] * len(columns["docId"])
+        columns["line"] = [line for line, row in zip(lines, rows) if len(row) == len(COLUMNS)]
+        found += checkColumns(columns)
+        if found:
+            errors += found
+            continue
+        sets = {}
+        for line, row in zip(columns["line"], rows):
+            sets.setdefault(row[1], []).append((line, row))
+        anns = dict((annotSet, annLines(setRows, text, fn, found)) for annotSet, setRows in sets.items())
+        if found:
+            errors += found
+            continue
+        for annotSet, ann in anns.items():
+            base = os.path.join(out, docId + "-" + annotSet)
+            with open(base + ".ann", "w", encoding="utf-8", newline="") as f:
+                f.writelines(line + "\n" for line in ann)
+            linkText(textPath, base + ".txt", links)
+            written.append(docId + "-" + annotSet + ".ann")
+    return written, errors
+
+
+def chunked(items, jobs):
+    """ items split into up to jobs contiguous chunks of nearly equal size """
+    n = max(min(jobs, len(items)), 1)
+    size, extra = divmod(len(items), n)
+    bounds = [i * size + min(i, extra) for i in range(n + 1)]
+    return [items[bounds[i]:bounds[i + 1]] for i in range(n)]
+
+
+def runChunks(fn, chunks, jobs, *args):
+    """ The files written and problems found by fn over every chunk, in up to jobs worker processes """
+    if jobs > 1 and len(chunks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(fn, chunks, *[[arg] * len(chunks) for arg in args]))
+    else:
+        results = [fn(chunk, *args) for chunk in chunks]
+    return [name for written, _ in results for name in written], [err for _, errors in results for err in errors]
+
+
+def loadBratDir(src, textDir=None, jobs=1):
+    """ The annotations of a BRAT directory as one frame, as loadTsvDir would give for its .tsv files, without writing them
+
+    Returns the .tsv names of the paragraphs read, the frame, and the problems
+    found; paragraphs with problems are left out of the frame.
+    """
+    import pandas as pd
+    from .corpus import decodeOther
+    chunks = chunked(list(bratParagraphs(src).items()), jobs)
+    if jobs > 1 and len(chunks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(bratFrameFiles, chunks, [src] * len(chunks), [textDir] * len(chunks)))
+    else:
+        results = [bratFrameFiles(chunk, src, textDir) for chunk in chunks]
+    names = [name for chunkNames, _, _ in results for name in chunkNames]
+    errors = [err for _, chunkErrors, _ in results for err in chunkErrors]
+    return names, decodeOther(pd.concat([frame for _, _, frame in results], ignore_index=True)), errors
+
+
+def bratToTsvDir(src, out, textDir=None, jobs=1):
+    """ Converts a BRAT directory into a directory of .tsv files, one per paragraph, in up to jobs worker processes """
+    os.makedirs(out, exist_ok=True)
+    paragraphs = list(bratParagraphs(src).items())
+    return runChunks(bratToTsvFiles, chunked(paragraphs, jobs), jobs, src, out, textDir)
+
+
+def tsvToBratDir(src, out, textDir, jobs=1, links="hard"):
+    """ Converts a directory of .tsv files into BRAT annotation sets, linking each .txt to the paragraph's one text file """
+    if links not in LINKS:
+        raise ValueError("links must be one of " + ", ".join(LINKS))
+    os.makedirs(out, exist_ok=True)
+    names = sorted(fn for fn in os.listdir(src) if fn.endswith(".tsv"))
+    return runChunks(tsvToBratFiles, chunked(names, jobs), jobs, src, out, textDir, links)
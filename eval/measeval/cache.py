@@ -0,0 +1,127 @@
+import os
+import json
+import pickle
+import hashlib
+
+from .corpus import GoldCorpus, TABLES, CATEGORIES_FILE
+
+# The gold-only side of scoring is the same on every run against the same gold data,
+# so a GoldCache keeps the prepared tables of a GoldCorpus on disk between runs.
+# Entries are keyed by a checksum of the content of the gold files and the category
+# file, so changing either one just leads to a new entry. When the cache grows past
+# its limits, the least recently used entries are removed first.
+
+# Bump this whenever the derived tables change shape, so old entries are never reused
+CACHE_VERSION = 2
+DEFAULT_MAX_BYTES = 1 << 30
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "measeval")
+
+
+def hashFile(h, path):
+    """ Adds the length and content of a file to a hash """
+    h.update(os.path.getsize(path).to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+
+def goldChecksum(path, categories=CATEGORIES_FILE):
+    """ A hex digest of the content of the gold data (a .tsv directory or packed file) and the categories """
+    h = hashlib.sha256()
+    h.update(("measeval-gold-cache " + str(CACHE_VERSION) + "\n").encode("utf-8"))
+    if os.path.isdir(path):
+        for fn in sorted(os.listdir(path)):
+            if fn.endswith(".tsv"):
+                h.update(fn.encode("utf-8") + b"\0")
+                hashFile(h, os.path.join(path, fn))
+    else:
+        h.update(b"packed\0")
+        hashFile(h, path)
+    h.update(b"categories\0")
+    if isinstance(categories, str):
+        hashFile(h, categories)
+    else:
+        h.update(json.dumps(sorted(categories.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+class GoldCache(object):
+    """ An on-disk cache of prepared GoldCorpus tables, keyed by goldChecksum and evicted least recently used first """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxBytes=DEFAULT_MAX_BYTES, maxEntries=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+
+    def entryPath(self, key):
+        """ Where the entry for a key is stored """
+        return os.path.join(self.directory, key + ".pickle")
+
+    def get(self, key):
+        """ The cached tables for a key, or None """
+        path = self.entryPath(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # A damaged entry is as good as a missing one
+            os.remove(path)
+            return None
+        # Mark the entry as recently used
+        os.utime(path)
+        return entry
+
+    def put(self, key, corpus):
+        """ Stores the tables of a corpus under a key, then evicts down to the size limits """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"files": corpus.files, "categories": corpus.categories}
+        entry.update((name, getattr(corpus, name)) for name in TABLES)
+        # Write to a temporary file first so readers never see a partial entry
+        path = self.entryPath(key)
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict(keep=key)
+
+    def entries(self):
+        """ (last used, size, key) for every entry, most recently used first """
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for fn in os.listdir(self.directory):
+            if fn.endswith(".pickle"):
+                stat = os.stat(os.path.join(self.directory, fn))
+                found.append((stat.st_mtime, stat.st_size, fn[:-len(".pickle")]))
+        return sorted(found, reverse=True)
+
+    def evict(self, keep=None):
+        """ Removes least recently used entries until the cache is within maxBytes and maxEntries """
+        total = 0
+        count = 0
+        for _, size, key in self.entries():
+            total += size
+            count += 1
+            if key != keep and (total > self.maxBytes or (self.maxEntries is not None and count > self.maxEntries)):
+                try:
+                    os.remove(self.entryPath(key))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                count -= 1
+
+    def load(self, path, files=None, categories=CATEGORIES_FILE):
+        """ A GoldCorpus for path, as GoldCorpus(path, files, categories) would give, prepared only on a cache miss """
+        key = goldChecksum(path, categories)
+        entry = self.get(key)
+        if entry is None:
+            corpus = GoldCorpus(path, categories=categories)
+            self.put(key, corpus)
+        else:
+            corpus = GoldCorpus.fromTables(path, entry["files"], entry["categories"], entry)
+        # The whole directory is cached; a list of files is applied afterwards
+        if files is not None:
+            corpus = corpus.restrict([fn[:-4] for fn in files if fn.endswith(".tsv")])
+        return corpus
@@ -0,0 +1,292 @@
+import io
+import os
+import re
+import json
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .packed import isPacked, readPacked, writePacked
+from .profiling import lap
+
+ANNOT_TYPES = ["Quantity", "MeasuredProperty", "MeasuredEntity", "Qualifier"]
+
+# Subject categories are mapped per article from fileCategories.txt
+# (mapper file taken from OA-STM-Corpus), which lives at the project root.
+CATEGORIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "fileCategories.txt")
+
+
+def readCategories(path=CATEGORIES_FILE):
+    """ Reads the article id to subject category mapping """
+    cats = {}
+    filecats = open(path, "r")
+    lines = filecats.readlines()
+    for line in lines:
+        cats[line.split('\t')[0]] = line.split('\t')[1].rstrip()
+    filecats.close()
+    return cats
+
+
+# Gold directories can hold tens of thousands of small files, and on shared storage
+# reading them one after another waits out the latency of every file in turn. So the
+# directory is listed once and files are picked by name (docId) before any of them is
+# opened; the picked files are read as bytes on a pool of threads, and their rows are
+# parsed together in one read_csv call, with explicit dtypes, into a single frame.
+# Files are only parsed one by one (and concatenated once) if their headers differ,
+# or if a field starts with a quote, which could run on into the next file.
+TSV_DTYPES = {"docId": str, "annotSet": np.int64, "annotType": str, "startOffset": np.int64,
+              "endOffset": np.int64, "annotId": str, "text": str, "other": str}
+READ_THREADS = 16
+QUOTED_FIELD = re.compile(rb'(?:^|\t)"', re.MULTILINE)
+
+
+def listTsvDir(path, skip=[], only=None):
+    """ Names of the .tsv files in a directory, leaving out those in skip and, if only is given, those not in it """
+    skip = set(skip)
+    only = set(only) if only is not None else None
+    return [fn for fn in os.listdir(path) if fn.endswith(".tsv") and fn not in skip and (only is None or fn in only)]
+
+
+def readBytes(paths):
+    """ The content of each file """
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    return blobs
+
+
+def readFiles(paths, threads=READ_THREADS):
+    """ The content of each file, read on up to threads threads, with the bytes read recorded for the profile """
+    if threads > 1 and len(paths) > 1:
+        # One contiguous chunk of files per thread, rather than a task per file
+        n = min(threads, len(paths))
+        size, extra = divmod(len(paths), n)
+        bounds = [i * size + min(i, extra) for i in range(n + 1)]
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            blobs = [blob for chunk in pool.map(readBytes, [paths[bounds[i]:bounds[i + 1]] for i in range(n)]) for blob in chunk]
+    else:
+        blobs = readBytes(paths)
+    lap("readFiles", len(blobs), nbytes=sum(len(blob) for blob in blobs))
+    return blobs
+
+
+def parseTsv(blob):
+    """ One .tsv file's content as a frame, with TSV_DTYPES for the columns it has """
+    header = blob.partition(b"\n")[0].rstrip(b"\r").decode("utf-8-sig").split("\t")
+    return pd.read_csv(io.BytesIO(blob), sep="\t", dtype=dict((col, TSV_DTYPES[col]) for col in header if col in TSV_DTYPES))
+
+
+def parseTsvFiles(blobs):
+    """ The content of several .tsv files as one frame, their rows in file order """
+    headers, bodies = [], []
+    for blob in blobs:
+        header, _, body = blob.partition(b"\n")
+        headers.append(header.rstrip(b"\r").lstrip(codecs.BOM_UTF8))
+        bodies.append(body if body.endswith(b"\n") or not body else body + b"\n")
+    if len(set(headers)) == 1 and headers[0] and not any(QUOTED_FIELD.search(body) for body in bodies):
+        return parseTsv(headers[0] + b"\n" + b"".join(bodies))
+    if not blobs:
+        return pd.DataFrame(dict((col, pd.Series(dtype=dtype)) for col, dtype in TSV_DTYPES.items()))
+    return pd.concat([parseTsv(blob) for blob in blobs], ignore_index=True)
+
+
+def readTsvDir(path, skip=[], only=None, threads=READ_THREADS):
+    """ Reads the .tsv files in a directory, returning their names and dataframes """
+    names = listTsvDir(path, skip, only)
+    blobs = readFiles([os.path.join(path, fn) for fn in names], threads)
+    return names, [parseTsv(blob) for blob in blobs]
+
+
+def loadTsvDir(path, skip=[], only=None, threads=READ_THREADS):
+    """ Loads a directory of .tsv files into one annotation frame with the other column decoded """
+    names = listTsvDir(path, skip, only)
+    frame = parseTsvFiles(readFiles([os.path.join(path, fn) for fn in names], threads))
+    lap("parse", frame)
+    return names, decodeOther(frame)
+
+
+def loadGold(path, only=None):
+    """ Loads gold annotations from either a directory of .tsv files or a packed gold file """
+    if isPacked(path):
+        return readPacked(path, only)
+    return loadTsvDir(path, only=only)
+
+
+def buildGold(path, out, skip=[]):
+    """ Packs a directory of gold .tsv files into one file that can be read in its place """
+    names, frame = loadTsvDir(path, skip)
+    writePacked(names, frame, out)
+    return names, frame
+
+
+# Prepared annotation frames are kept compact, since every stage of the alignment
+# carries their columns along: docId, annotType, and relType are categoricals,
+# annotSet and the offsets are int32, and the empty score fields are float NaN
+# rather than object None. None of this changes a score: SQLite sees the same values.
+CATEGORY_COLUMNS = ["docId", "annotType", "relType"]
+INT32_COLUMNS = ["annotSet", "startOffset", "endOffset"]
+
+
+def compactFrame(df):
+    """ Returns an annotation frame with CATEGORY_COLUMNS as categoricals and INT32_COLUMNS as int32, sharing every other column """
+    df = df.copy(deep=False)
+    for col in INT32_COLUMNS:
+        if col in df.columns and df[col].dtype != np.int32:
+            values = df[col].to_numpy()
+            if values.dtype.kind == "i" and (len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max)):
+                df[col] = values.astype(np.int32)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def prepareFrame(df):
+    """ Returns a compact copy of an annotation frame (see compactFrame) with empty score fields for later lambdas """
+    df = compactFrame(df)
+    df['EM'] = np.nan
+    df['F1'] = np.nan
+    df['maxF1'] = np.nan
+    return df
+
+
+# The other column holds json: the unit and modifiers of a Quantity, or the
+# relationship type and target for MeasuredEntity, MeasuredProperty, and Qualifier.
+# We decode it once, when the data is loaded, into typed columns that every later stage reuses:
+# - unit: the unit, or "" if there is none
+# - mods: the list of modifiers, or "" if there are none (exploded per modifier by explodeMods)
+# - relType, target: the relationship type and target annotId, or None for Quantities
+# Distinct json strings are decoded only once; most rows share a handful of values.
+DECODED_COLUMNS = ["unit", "mods", "relType", "target"]
+
+def decodeOther(df):
+    """ Returns a copy of an annotation frame with the other column decoded into DECODED_COLUMNS """
+    df = df.copy(deep=False)
+    codes, uniques = pd.factorize(df["other"])
+    # The extra last entry is what rows with an empty other field pick up through code -1
+    units = np.empty(len(uniques) + 1, dtype=object)
+    mods = np.empty(len(uniques) + 1, dtype=object)
+    relTypes = np.empty(len(uniques) + 1, dtype=object)
+    targets = np.empty(len(uniques) + 1, dtype=object)
+    units[-1] = ""
+    mods[-1] = ""
+    for i, other in enumerate(uniques):
+        data = json.loads(str(other))
+        units[i] = data["unit"] if "unit" in data.keys() else ""
+        mods[i] = data["mods"] if "mods" in data.keys() else ""
+        if len(data) > 0:
+            relTypes[i] = list(data.keys())[0]
+            targets[i] = list(data.values())[0]
+    isQuantity = (df["annotType"] == "Quantity").to_numpy()
+    df["unit"] = units[codes]
+    df["mods"] = mods[codes]
+    df["relType"] = np.where(isQuantity, None, relTypes[codes])
+    df["target"] = np.where(isQuantity, None, targets[codes])
+    return df
+
+
+def ofType(df, annotTypes):
+    """ Rows of the given annotType(s), without the mods lists, which can't go through pandasql """
+    if isinstance(annotTypes, str):
+        annotTypes = [annotTypes]
+    return df.loc[df["annotType"].isin(annotTypes)].drop(columns=["mods"], errors="ignore")
+
+
+def explodeMods(quants):
+    """ One row per modifier of each Quantity """
+    # Note the use of "explodes" -- this requires Pandas >= 1.0.
+    mods = quants.explode('mods')
+    return mods[mods.mods != ""]
+
+
+# The frame a GoldCorpus holds and the gold-only tables it derives from it
+TABLES = ["frame", "quants", "entities", "properties", "qualifiers", "units", "rels", "mods"]
+
+
+class GoldCorpus(object):
+    """ Gold annotations plus the gold-only tables derived from them, prepared once and reused across submissions """
+
+    def __init__(self, path=None, files=None, categories=CATEGORIES_FILE, frame=None):
+        self.path = path
+        if frame is None:
+            # Currently, we are only checking against files present in the submission
+            # when a list of files is given.
+            # This is so that users can evaluate whatever portion of the data
+            # they chose to keep separate from their training data.
+            self.files, frame = loadGold(path, only=files)
+        else:
+            self.files = [d + ".tsv" for d in frame.docId.unique()]
+            if "relType" not in frame.columns:
+                frame = decodeOther(frame)
+        self.frame = prepareFrame(frame)
+        self.categories = readCategories(categories) if isinstance(categories, str) else categories
+        self.tokens = {}
+        self._derive()
+
+    @classmethod
+    def fromFrame(cls, frame, categories=CATEGORIES_FILE):
+        """ Builds a corpus from an in-memory gold frame """
+        return cls(frame=frame, categories=categories)
+
+    @classmethod
+    def fromTables(cls, path, files, categories, tables):
+        """ Builds a corpus from already derived tables, e.g. a view or a cached copy """
+        corpus = object.__new__(cls)
+        corpus.path = path
+        corpus.files = files
+        corpus.categories = categories
+        corpus.tokens = {}
+        for name in TABLES:
+            setattr(corpus, name, tables[name])
+        return corpus
+
+    def _derive(self):
+        gold = self.frame
+
+        self.quants = ofType(gold, "Quantity")
+        self.entities = ofType(gold, "MeasuredEntity")
+        self.properties = ofType(gold, "MeasuredProperty")
+        self.qualifiers = ofType(gold, "Qualifier")
+
+        # Units, relationships, and modifiers come from the decoded other column
+        goldUnits = self.quants[self.quants.other.notnull()]
+        self.units = goldUnits[goldUnits.unit != ""][["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "unit"]]
+
+        tmpgRels = ofType(gold, ["MeasuredEntity", "MeasuredProperty", "Qualifier"]).rename(columns={"annotId": "src"})
+        self.rels = tmpgRels[["docId", "annotSet", "annotType", "relType", "src", "target"]]
+
+        # There can be more than one modifier per Quantity
+        goldMods = gold.loc[(gold["annotType"] == "Quantity") & gold.other.notnull()]
+        self.mods = explodeMods(goldMods)[["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "mods", "EM", "F1", "maxF1"]]
+
+    def restrict(self, docIds):
+        """ Returns a view of this corpus limited to the given docIds, without re-reading or re-deriving anything """
+        docIds = set(docIds)
+        tables = {}
+        for name in TABLES:
+            table = getattr(self, name)
+            tables[name] = table[table.docId.isin(docIds)]
+        corpus = GoldCorpus.fromTables(self.path, [fn for fn in self.files if fn[:-4] in docIds], self.categories, tables)
+        # Token indexes cover every paragraph text, so views share them
+        corpus.tokens = self.tokens
+        return corpus
+
+    def tokenIndex(self, tokenizer="whitespace", textDir=None):
+        """ The TokenIndex of the paragraph texts (by default, the text directory next to the gold data), built once per tokenizer """
+        from .tokens import TokenIndex, textDirFor
+        textDir = textDir if textDir is not None else textDirFor(self.path)
+        if textDir is None:
+            raise ValueError("No paragraph text directory next to {}; give one with --text".format(self.path))
+        if not os.path.isdir(textDir):
+            raise ValueError("Paragraph text directory {} does not exist".format(textDir))
+        if (tokenizer, textDir) not in self.tokens:
+            index = TokenIndex.fromDir(textDir, tokenizer)
+            # Every gold paragraph needs its text, or counting its spans fails halfway through scoring
+            missing = index.missing(self.frame["docId"])
+            if missing:
+                raise ValueError("No paragraph text in {} for {} gold paragraph(s): {}{}".format(
+                    textDir, len(missing), ", ".join(missing[:5]), ", ..." if len(missing) > 5 else ""))
+            self.tokens[(tokenizer, textDir)] = index
+        return self.tokens[(tokenizer, textDir)]
@@ -0,0 +1,113 @@
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+from .scoring import shardScoreTables, orderScoreTable
+
+# Incremental scoring.
+# Every join in align is keyed on docId, so the score table rows for one paragraph
+# only depend on that paragraph's submission and gold rows, its subject, and the
+# scorer itself. A ScoreStore keeps the rows of the last run for each paragraph,
+# keyed by a hash of all of those (and the alignment, units, and tokens used). The next run only aligns paragraphs whose hash
+# changed, then puts cached and fresh rows back in the order a full run produces
+# them (the same reordering -j relies on), so every average is bit for bit the same.
+# Only the rows of the latest run are kept.
+
+# The rows only depend on these source files of the scorer, so editing any of them
+# invalidates every stored row.
+SCORER_FILES = ["corpus.py", "intervals.py", "matching.py", "relations.py", "scoring.py", "tokens.py", "units.py"]
+RAW_COLUMNS = ["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "other"]
+
+
+def scorerDigest():
+    """ A hash of the scorer source files """
+    h = hashlib.sha256()
+    for fn in SCORER_FILES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), fn), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def docDigests(df):
+    """ A hash of the annotation rows of each docId in a frame, in the order they appear """
+    rowHashes = pd.util.hash_pandas_object(df[RAW_COLUMNS], index=False).to_numpy()
+    codes, docIds = pd.factorize(df["docId"])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(docIds) + 1))
+    digests = {}
+    for i, docId in enumerate(docIds):
+        digests[docId] = hashlib.sha256(rowHashes[order[bounds[i]:bounds[i + 1]]].tobytes()).hexdigest()
+    return digests
+
+
+def docKeys(gold, sub, alignment="all", units="strict", tokens=None):
+    """ The store key of every docId in gold or the submission, in submission then gold order """
+    scorer = scorerDigest()
+    tokenizer = tokens.digest if tokens is not None else "spaces"
+    subDigests = docDigests(sub)
+    goldDigests = docDigests(gold.frame)
+    keys = {}
+    for docId in list(subDigests) + list(goldDigests):
+        subject = gold.categories.get(docId.split("-")[0])
+        parts = [scorer, alignment, units, tokenizer, docId, subDigests.get(docId, "-"), goldDigests.get(docId, "-"), str(subject)]
+        keys[docId] = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+    return keys
+
+
+class ScoreStore(object):
+    """ Score table rows of the last run, per paragraph, kept in one file between runs """
+
+    def __init__(self, path):
+        self.path = path
+        self.table = None
+        self.spans = {}
+        # The docIds the last scoreTable call had to align
+        self.aligned = []
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.table, self.spans = pickle.load(f)
+
+    def rows(self, keys):
+        """ The stored rows for the given keys, in the order given """
+        if not keys:
+            return None
+        positions = np.concatenate([np.arange(*self.spans[key]) for key in keys])
+        return self.table.iloc[positions]
+
+    def save(self, table, keys):
+        """ Replaces the store with the rows of a run, which must be grouped by docId, keyed by docKeys """
+        spans = {}
+        codes, docIds = pd.factorize(table["docId"])
+        bounds = np.searchsorted(codes, np.arange(len(docIds) + 1))
+        for i, docId in enumerate(docIds):
+            spans[keys[docId]] = (int(bounds[i]), int(bounds[i + 1]))
+        # Paragraphs without any rows still need an (empty) entry
+        for key in keys.values():
+            spans.setdefault(key, (0, 0))
+        tmp = self.path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((table, spans), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.table, self.spans = table, spans
+
+    def scoreTable(self, gold, sub, jobs=1, alignment="all", units="strict", tokens=None):
+        """ Builds the score table, aligning only the paragraphs whose rows aren't stored, and stores the result """
+        keys = docKeys(gold, sub, alignment, units, tokens)
+        cached = [docId for docId in keys if keys[docId] in self.spans]
+        changed = [docId for docId in keys if keys[docId] not in self.spans]
+
+        parts = []
+        if cached:
+            parts.append(self.rows([keys[docId] for docId in cached]))
+        if changed:
+            parts.append(shardScoreTables(gold.restrict(changed), sub[sub["docId"].isin(changed)], jobs, alignment, units, tokens))
+        wrk1score = pd.concat(parts, ignore_index=True)
+
+        # Group rows by paragraph for the store, keeping their order within each paragraph
+        rank = pd.Index(list(keys)).get_indexer(wrk1score["docId"])
+        wrk1score = wrk1score.iloc[np.argsort(rank, kind="stable")].reset_index(drop=True)
+        self.save(wrk1score, keys)
+        self.aligned = changed
+        return orderScoreTable(wrk1score, gold, sub)
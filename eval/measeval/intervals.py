@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Overlap joins for span matching.
+# Two spans overlap if either endpoint of one falls within the other, with offsets
+# treated as closed intervals. That is the same four-way condition the theta joins
+# in pandasql used, but SQLite can't index it, so every sub x gold pair in a document
+# was compared. Here we sort the gold spans by (key, start) once and, for each
+# submission span, only look at gold spans in the same key whose start falls within
+# [start - longest gold span in that key, end].
+# Plain equality joins on the same integer key codes are done by sorting once as well.
+
+
+def keyCodes(left, right, leftOn, rightOn):
+    """ Shared integer codes for the join keys of two frames, -1 where any key is null """
+    lCodes = np.zeros(len(left), dtype=np.int64)
+    rCodes = np.zeros(len(right), dtype=np.int64)
+    lNull = np.zeros(len(left), dtype=bool)
+    rNull = np.zeros(len(right), dtype=bool)
+    for lCol, rCol in zip(leftOn, rightOn):
+        codes, uniques = pd.factorize(pd.concat([left[lCol], right[rCol]], ignore_index=True))
+        lPart, rPart = codes[:len(left)], codes[len(left):]
+        lNull |= lPart < 0
+        rNull |= rPart < 0
+        lCodes = lCodes * (len(uniques) + 1) + lPart
+        rCodes = rCodes * (len(uniques) + 1) + rPart
+    codes, _ = pd.factorize(np.concatenate([lCodes, rCodes]))
+    lCodes, rCodes = codes[:len(left)], codes[len(left):]
+    lCodes[lNull] = -1
+    rCodes[rNull] = -1
+    return lCodes, rCodes
+
+
+def overlapPairs(lKeys, lStart, lEnd, rKeys, rStart, rEnd):
+    """ Positional (left, right) index pairs of overlapping spans that share a key
+
+    Keys are non-negative integer codes (negative keys never match). Pairs come back
+    ordered by left position, then right position, the order a nested loop join over
+    the left frame would produce them in.
+    """
+    lStart = np.asarray(lStart, dtype=np.int64)
+    lEnd = np.asarray(lEnd, dtype=np.int64)
+    rStart = np.asarray(rStart, dtype=np.int64)
+    rEnd = np.asarray(rEnd, dtype=np.int64)
+    lKeys = np.asarray(lKeys, dtype=np.int64)
+    rKeys = np.asarray(rKeys, dtype=np.int64)
+
+    rIdx = np.flatnonzero(rKeys >= 0)
+    lIdx = np.flatnonzero(lKeys >= 0)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(rIdx) == 0 or len(lIdx) == 0:
+        return empty, empty
+
+    # Sort the right side by (key, start)
+    order = rIdx[np.lexsort((rStart[rIdx], rKeys[rIdx]))]
+    sKeys, sStart, sEnd = rKeys[order], rStart[order], rEnd[order]
+
+    # Longest right span per key bounds how far back an overlapping span can start
+    nKeys = int(max(sKeys.max(), lKeys.max())) + 1
+    maxLen = np.zeros(nKeys, dtype=np.int64)
+    np.maximum.at(maxLen, sKeys, np.maximum(sEnd - sStart, 0))
+
+    # Combine key and start into one sortable value so a single searchsorted
+    # finds the window within each key.
+    base = min(lStart.min(), sStart.min()) - int(maxLen.max()) - 1
+    width = max(lEnd.max(), sEnd.max()) - base + 2
+    combined = sKeys * width + (sStart - base)
+
+    qKeys = lKeys[lIdx]
+    lo = np.searchsorted(combined, qKeys * width + (lStart[lIdx] - maxLen[qKeys] - base), side="left")
+    hi = np.searchsorted(combined, qKeys * width + (lEnd[lIdx] - base), side="right")
+
+    # Expand each window into candidate pairs
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        return empty, empty
+    li = np.repeat(lIdx, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    pos = np.repeat(lo, counts) + offsets
+
+    # Keep the candidates that actually overlap
+    keep = sEnd[pos] >= lStart[li]
+    li = li[keep]
+    ri = order[pos[keep]]
+
+    pairOrder = np.lexsort((ri, li))
+    return li[pairOrder], ri[pairOrder]
+
+
+def overlapJoin(left, right, leftOn, rightOn, leftSpan=("startOffset", "endOffset"), rightSpan=("startOffset", "endOffset")):
+    """ Positional index pairs of rows in two frames whose keys match and whose spans overlap """
+    lKeys, rKeys = keyCodes(left, right, leftOn, rightOn)
+    return overlapPairs(lKeys, left[leftSpan[0]].to_numpy(), left[leftSpan[1]].to_numpy(),
+                        rKeys, right[rightSpan[0]].to_numpy(), right[rightSpan[1]].to_numpy())
+
+
+def selectPairs(s, g, li, ri, columns):
+    """ Builds a joined frame from index pairs, with columns listed SQL-style, e.g. "s.docId, g.annotId as gAnnotId" """
+    sRows = s.iloc[li].reset_index(drop=True)
+    gRows = g.iloc[ri].reset_index(drop=True)
+    out = {}
+    for item in columns.split(","):
+        parts = item.split()
+        alias = parts[2] if len(parts) == 3 and parts[1].lower() == "as" else parts[0].split(".")[1]
+        table, col = parts[0].split(".")
+        out[alias] = (sRows if table == "s" else gRows)[col]
+    return pd.DataFrame(out)
+
+
+def equiPairs(lKeys, rKeys):
+    """ Positional (left, right) index pairs of equal non-negative keys, ordered by left position, then right position """
+    lKeys = np.asarray(lKeys, dtype=np.int64)
+    rKeys = np.asarray(rKeys, dtype=np.int64)
+    rIdx = np.flatnonzero(rKeys >= 0)
+    lIdx = np.flatnonzero(lKeys >= 0)
+    # A stable sort keeps the right rows of each key in their original order
+    order = rIdx[np.argsort(rKeys[rIdx], kind="stable")]
+    sKeys = rKeys[order]
+    lo = np.searchsorted(sKeys, lKeys[lIdx], side="left")
+    counts = np.searchsorted(sKeys, lKeys[lIdx], side="right") - lo
+    total = int(counts.sum())
+    li = np.repeat(lIdx, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return li, order[np.repeat(lo, counts) + offsets]
@@ -0,0 +1,99 @@
+import os
+import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from .report import CLASSES
+from .scoring import score
+from .validation import validateDir
+
+# Batch scoring of many submission directories against one gold corpus, e.g. an
+# ablation grid. Gold is loaded and prepared once. Worker processes get it from the
+# parent instead of each loading their own: where processes are forked it is simply
+# inherited (copy on write, so never copied unless written to), otherwise it is
+# pickled once per worker rather than once per submission.
+
+OVERALL_COLUMNS = ["tp", "fp", "fn", "precision", "recall", "fmeasure", "EM", "F1"]
+
+# The gold corpus the runs in this process are scored against
+SHARED = {}
+
+
+def shareGold(gold):
+    """ Makes gold the corpus runs in this process are scored against """
+    SHARED["gold"] = gold
+
+
+def expandRuns(patterns, indir=""):
+    """ Submission directories matching each pattern (a path or a glob), in the order given """
+    runs = []
+    for pattern in patterns:
+        # A path given explicitly is kept even if it isn't a directory, so its row says what went wrong
+        matches = [path for path in sorted(glob.glob(indir + pattern)) if os.path.isdir(path)] if glob.has_magic(pattern) else [indir + pattern]
+        runs.extend(path for path in matches if path not in runs)
+    return runs
+
+
+def leaderboardRow(run, results):
+    """ One leaderboard row: overall counts and scores, and EM and F1 per class """
+    row = {"run": run, "status": "ok"}
+    for col in OVERALL_COLUMNS:
+        row[col] = results["overall"][col]
+    for annotType in CLASSES:
+        row[annotType + " EM"] = results["class"][annotType]["EM"]
+        row[annotType + " F1"] = results["class"][annotType]["F1"]
+    return row
+
+
+def scoreRun(run, path, skip=[], limit=False, alignment="all", units="strict", tokens=None):
+    """ Validates and scores one submission directory against the shared gold corpus """
+    if not os.path.isdir(path):
+        return {"run": run, "status": "error: no such directory"}
+    try:
+        report = validateDir(path, skip)
+        if report.badfiles:
+            return {"run": run, "status": "invalid: " + ", ".join(report.badfiles)}
+        sub = report.frame()
+        docIds = [fn[:-4] for fn in report.names] if limit else None
+        return leaderboardRow(run, score(SHARED["gold"], sub, modes=["overall", "class"], docIds=docIds,
+                                              alignment=alignment, units=units, tokens=tokens))
+    except Exception as e:
+        # One broken run shouldn't take the rest of the batch down with it
+        return {"run": run, "status": "error: " + repr(e)}
+
+
+def scoreRuns(gold, paths, names=None, jobs=1, skip=[], limit=False, alignment="all", units="strict", tokens=None):
+    """ A leaderboard frame for many submission directories, best overall F1 first """
+    names = names if names is not None else paths
+    shareGold(gold)
+    if jobs > 1 and len(paths) > 1:
+        workers = min(jobs, len(paths))
+        if "fork" in multiprocessing.get_all_start_methods():
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=shareGold, initargs=(gold,))
+        with pool:
+            rows = list(pool.map(scoreRun, names, paths, [skip] * len(paths), [limit] * len(paths), [alignment] * len(paths),
+                                  [units] * len(paths), [tokens] * len(paths)))
+    else:
+        rows = [scoreRun(name, path, skip, limit, alignment, units, tokens) for name, path in zip(names, paths)]
+
+    columns = ["run", "status"] + OVERALL_COLUMNS + [annotType + " " + metric for annotType in CLASSES for metric in ["EM", "F1"]]
+    board = pd.DataFrame(rows, columns=columns)
+    # Runs that failed have no counts, which would otherwise turn every count into a float
+    board[["tp", "fp", "fn"]] = board[["tp", "fp", "fn"]].astype("Int64")
+    board = board.sort_values("F1", ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+    board.index = board.index + 1
+    board.index.name = "rank"
+    return board
+
+
+def writeLeaderboard(board, path):
+    """ Writes a leaderboard as csv, tsv, or json, depending on the extension of path """
+    if path.endswith(".json"):
+        board.reset_index().to_json(path, orient="records", indent=2)
+    elif path.endswith(".tsv"):
+        board.to_csv(path, sep="\t")
+    else:
+        board.to_csv(path)
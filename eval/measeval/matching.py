@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# One-to-one alignment of overlapping spans.
+# The overlap join pairs every submission span with every gold span it overlaps, so
+# one gold Quantity can be credited to several submission Quantities (and the other
+# way around), and everything keyed on those pairs grows with their product. Here
+# the pairs of each document are cut down to a maximum weight matching, weighted by
+# their overlap F1, so every span is in at most one pair.
+# The matching is solved with the Hungarian algorithm, one document at a time, on a
+# dense matrix of only the spans that overlap something; pairs that don't overlap
+# get weight 0 and are dropped from the matching again.
+
+
+def assignment(cost):
+    """ Column assigned to each row of a cost matrix with no more rows than columns, minimizing the total cost """
+    n, m = cost.shape
+    # Potentials and the row matched to each column, 1-based with column 0 as the root
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        # Grow a tree of tight edges from row i until it reaches a free column
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            slack = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(slack)) + 1
+            delta = slack[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # Flip the path back to the root
+        while j0 != 0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    rows = np.full(n, -1, dtype=np.int64)
+    cols = np.flatnonzero(p[1:])
+    rows[p[1:][cols] - 1] = cols
+    return rows
+
+
+def maxWeightPairs(left, right, weights):
+    """ Mask of the pairs (left node, right node, weight) in a maximum weight matching """
+    lNodes, lCodes = np.unique(left, return_inverse=True)
+    rNodes, rCodes = np.unique(right, return_inverse=True)
+    matrix = np.zeros((len(lNodes), len(rNodes)))
+    # Of duplicate pairs, the last one is the one kept
+    matrix[lCodes, rCodes] = weights
+    transposed = len(lNodes) > len(rNodes)
+    cost = -(matrix.T if transposed else matrix)
+    rows = assignment(cost)
+    matched = np.zeros(cost.shape, dtype=bool)
+    matched[np.arange(len(rows)), rows] = True
+    if transposed:
+        matched = matched.T
+    position = np.full(matrix.shape, -1, dtype=np.int64)
+    position[lCodes, rCodes] = np.arange(len(left))
+    keep = np.zeros(len(left), dtype=bool)
+    # Empty cells of the matrix weigh nothing too, so pairs are told from them by position, not weight
+    keep[position[matched & (position >= 0)]] = True
+    # A pair weighing nothing adds nothing to the matching, which may leave it out with both its nodes free
+    lUsed = np.zeros(len(lNodes), dtype=bool)
+    rUsed = np.zeros(len(rNodes), dtype=bool)
+    lUsed[lCodes[keep]] = True
+    rUsed[rCodes[keep]] = True
+    for i in np.flatnonzero(~keep):
+        if not lUsed[lCodes[i]] and not rUsed[rCodes[i]]:
+            keep[i] = lUsed[lCodes[i]] = rUsed[rCodes[i]] = True
+    return keep
+
+
+def oneToOne(docIds, left, right, weights):
+    """ Mask of the candidate pairs kept by a maximum weight one-to-one matching within each document
+
+    docIds, left, and right give each pair's document and the positions of its two
+    spans; weights are their overlap F1 scores. These can be 0, when the spans overlap in
+    characters but share no token of a TokenIndex; such a pair is still kept wherever
+    neither of its spans is matched to another.
+    """
+    keep = np.zeros(len(left), dtype=bool)
+    if len(left) == 0:
+        return keep
+    codes, _ = pd.factorize(np.asarray(docIds))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(codes.max() + 2))
+    left, right, weights = np.asarray(left), np.asarray(right), np.asarray(weights, dtype=np.float64)
+    for i in range(len(bounds) - 1):
+        pairs = order[bounds[i]:bounds[i + 1]]
+        # A document whose spans each overlap at most one other span is already one-to-one
+        if len(np.unique(left[pairs])) == len(pairs) and len(np.unique(right[pairs])) == len(pairs):
+            keep[pairs] = True
+            continue
+        keep[pairs] = maxWeightPairs(left[pairs], right[pairs], weights[pairs])
+    return keep
@@ -0,0 +1,117 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# A packed gold corpus is one file holding every annotation of a gold directory,
+# column by column, so it can be opened with a single read instead of one open and
+# parse per paragraph. The layout is:
+# - MAGIC, then the length of the json header as 8 little-endian bytes
+# - the json header: row count, the .tsv file names, and where each array starts
+# - the arrays, each aligned to ALIGN bytes so they can be memory-mapped in place
+# Integer columns are stored as int32. Every string column, including the fields
+# decoded from other, is dictionary encoded: int32 codes (-1 for missing) into a
+# utf-8 blob of its distinct values. Modifier lists are stored as their json.
+
+MAGIC = b"MEASEVAL-GOLD\x01\n"
+ALIGN = 64
+
+INT_COLUMNS = ["annotSet", "startOffset", "endOffset"]
+STRING_COLUMNS = ["docId", "annotType", "annotId", "text", "other", "unit", "relType", "target"]
+COLUMNS = ["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "other",
+           "unit", "mods", "relType", "target"]
+
+
+def isPacked(path):
+    """ Whether path is a packed gold corpus file """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def packStrings(values):
+    """ Dictionary encodes a column of strings into int32 codes, a utf-8 blob, and the character bounds of each value """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    uniques = [str(u) for u in uniques]
+    bounds = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum([len(u) for u in uniques], out=bounds[1:])
+    blob = np.frombuffer("".join(uniques).encode("utf-8"), dtype=np.uint8)
+    return codes.astype(np.int32), blob, bounds
+
+
+def unpackStrings(blob, bounds, missing=np.nan):
+    """ The distinct values packStrings encoded, as an object array with missing appended for code -1 """
+    text = blob.tobytes().decode("utf-8")
+    uniques = np.empty(len(bounds), dtype=object)
+    uniques[:-1] = [text[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    uniques[-1] = missing
+    return uniques
+
+
+def writePacked(names, frame, path):
+    """ Writes a decoded gold annotation frame, read from the given .tsv files, to one packed file """
+    arrays = {}
+    for col in INT_COLUMNS:
+        values = frame[col].to_numpy(dtype=np.int64)
+        if len(values) and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+            raise ValueError("Column " + col + " does not fit in int32")
+        arrays[col] = values.astype(np.int32)
+    mods = [json.dumps(m) if isinstance(m, list) else m for m in frame["mods"]]
+    for col, values in [(col, frame[col]) for col in STRING_COLUMNS] + [("mods", mods)]:
+        arrays[col + ".codes"], arrays[col + ".blob"], arrays[col + ".bounds"] = packStrings(values)
+
+    # Lay the arrays out after the header, each on an ALIGN boundary
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"rows": len(frame), "files": list(names), "arrays": layout}).encode("utf-8")
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+
+
+def readPacked(path, only=None):
+    """ Reads a packed gold file, returning its .tsv names and the decoded annotation frame, as loadTsvDir would """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a packed gold corpus")
+        size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(size).decode("utf-8"))
+    start = -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+
+    def array(name):
+        spec = header["arrays"][name]
+        if spec["length"] == 0:
+            return np.zeros(0, dtype=spec["dtype"])
+        return np.memmap(path, dtype=spec["dtype"], mode="r", offset=start + spec["offset"], shape=(spec["length"],))
+
+    names = header["files"]
+    keep = slice(None)
+    if only is not None:
+        only = set(only)
+        names = [fn for fn in names if fn in only]
+        # docIds are stored once each, so the filter is decided on the distinct values
+        docIds = unpackStrings(array("docId.blob"), array("docId.bounds"))
+        keep = np.isin(array("docId.codes"), np.flatnonzero(np.isin(docIds, [fn[:-4] for fn in names])))
+
+    df = {}
+    for col in COLUMNS:
+        if col in INT_COLUMNS:
+            df[col] = array(col)[keep].astype(np.int64)
+        else:
+            uniques = unpackStrings(array(col + ".blob"), array(col + ".bounds"), None if col in ["relType", "target"] else np.nan)
+            if col == "mods":
+                for i, m in enumerate(uniques[:-1]):
+                    uniques[i] = json.loads(m) if m.startswith("[") else m
+            df[col] = uniques[array(col + ".codes")[keep]]
+    return names, pd.DataFrame(df)
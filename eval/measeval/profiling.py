@@ -0,0 +1,166 @@
+import sys
+import time
+import json
+import contextlib
+
+# Per-stage instrumentation.
+# A Profiler records wall time, CPU time, rows in and out, and how far resident
+# memory peaked above where it started, for every named stage, and for stages that
+# read files, how many bytes they read (shown as throughput). Stages nest:
+# stage(name) wraps a block, and lap(name) records a step inside the innermost open
+# stage, from the end of the previous step (or the start of the stage) until now.
+# The scorer calls stage and lap around every join; both do nothing unless a
+# Profiler has been made active with profiled().
+# Peak memory is exact per stage where the OS lets us reset the high water mark
+# (Linux, through /proc/self/clear_refs). Elsewhere it is the peak of the process so
+# far, so a stage only shows a delta if it raised that peak; on Windows it is not
+# measured at all.
+
+ACTIVE = {}
+
+
+def resetPeak():
+    """ Resets the peak resident memory of this process, where the OS allows it """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def memoryStatus():
+    """ Current and peak resident memory of this process in MB """
+    try:
+        values = {}
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    values[line[:5]] = int(line.split()[1]) / 1024
+        return values["VmRSS"], values["VmHWM"]
+    except (OSError, KeyError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows has neither /proc nor resource, so memory goes unmeasured there
+        return 0.0, 0.0
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    scale = 1 << 20 if sys.platform == "darwin" else 1 << 10
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return peak, peak
+
+
+def rowCount(rows):
+    """ Total rows of a frame, a list of frames, or a count """
+    if rows is None or isinstance(rows, int):
+        return rows
+    if isinstance(rows, (list, tuple)):
+        return sum(len(frame) for frame in rows)
+    return len(rows)
+
+
+class Profiler(object):
+    """ Wall time, CPU time, rows, and peak memory of named, nested stages """
+
+    def __init__(self):
+        self.records = []
+        # Open stages, and where the next step in each of them starts
+        self.open = []
+        self.marks = [self.now()]
+
+    def now(self):
+        """ Wall and CPU time and resident memory now, after noting the peak since the last call in every open stage """
+        rss, peak = memoryStatus()
+        for record in self.open:
+            record["peakMB"] = max(record["peakMB"], peak)
+        resetPeak()
+        return time.perf_counter(), time.process_time(), rss
+
+    def begin(self, name, start, rowsIn, nbytes=None):
+        """ A new record for a stage or step starting at start """
+        record = {"stage": name, "depth": len(self.open), "wall": None, "cpu": None, "rowsIn": rowCount(rowsIn),
+                  "rowsOut": None, "bytes": nbytes, "startMB": start[2], "peakMB": start[2], "peakDeltaMB": None}
+        self.records.append(record)
+        return record
+
+    def end(self, record, start, rowsOut):
+        """ Completes a record begun at start, returning the time it ended """
+        self.open.append(record)
+        end = self.now()
+        self.open.pop()
+        record["wall"] = end[0] - start[0]
+        record["cpu"] = end[1] - start[1]
+        record["peakDeltaMB"] = max(record["peakMB"] - record["startMB"], 0.0)
+        if rowsOut is not None:
+            record["rowsOut"] = rowCount(rowsOut)
+        return end
+
+    @contextlib.contextmanager
+    def stage(self, name, rowsIn=None):
+        """ Records the enclosed block as a stage; set "rowsOut" on the yielded record to report its output """
+        start = self.now()
+        record = self.begin(name, start, rowsIn)
+        self.open.append(record)
+        self.marks.append(start)
+        try:
+            yield record
+        finally:
+            self.open.pop()
+            self.marks.pop()
+            self.marks[-1] = self.end(record, start, record["rowsOut"])
+
+    def lap(self, name, rowsOut=None, rowsIn=None, nbytes=None):
+        """ Records the step since the last one in the innermost open stage, which read nbytes if given """
+        start = self.marks[-1]
+        self.marks[-1] = self.end(self.begin(name, start, rowsIn, nbytes), start, rowsOut)
+
+    def report(self):
+        """ The records, in the order their stages began """
+        return [dict(record) for record in self.records]
+
+
+@contextlib.contextmanager
+def profiled(profiler):
+    """ Makes stage and lap record to profiler within the enclosed block (None turns profiling off) """
+    previous = ACTIVE.get("profiler")
+    ACTIVE["profiler"] = profiler
+    try:
+        yield profiler
+    finally:
+        ACTIVE["profiler"] = previous
+
+
+@contextlib.contextmanager
+def stage(name, rowsIn=None):
+    """ Profiler.stage of the active profiler, if there is one """
+    profiler = ACTIVE.get("profiler")
+    if profiler is None:
+        yield {}
+    else:
+        with profiler.stage(name, rowsIn) as record:
+            yield record
+
+
+def lap(name, rowsOut=None, rowsIn=None, nbytes=None):
+    """ Profiler.lap of the active profiler, if there is one """
+    profiler = ACTIVE.get("profiler")
+    if profiler is not None:
+        profiler.lap(name, rowsOut, rowsIn, nbytes)
+
+
+def printProfile(records):
+    """ Prints profile records as a table, steps indented under their stage """
+    print("{:<32} {:>9} {:>9} {:>10} {:>10} {:>10} {:>10}".format("stage", "wall (s)", "cpu (s)", "rows in", "rows out", "peak +MB", "MB/s"))
+    for record in records:
+        rows = ["" if record[col] is None else str(record[col]) for col in ["rowsIn", "rowsOut"]]
+        nbytes = record.get("bytes")
+        throughput = "" if nbytes is None else "{:.1f}".format(nbytes / (1 << 20) / max(record["wall"], 1e-9))
+        print("{:<32} {:>9.3f} {:>9.3f} {:>10} {:>10} {:>10.1f} {:>10}".format(
+            "  " * record["depth"] + record["stage"], record["wall"], record["cpu"], rows[0], rows[1], record["peakDeltaMB"], throughput))
+
+
+def writeProfile(records, path):
+    """ Writes profile records to path as json """
+    with open(path, "w") as f:
+        json.dump({"peakReset": resetPeak(), "stages": records}, f, indent=2)
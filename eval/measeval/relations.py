@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from .intervals import keyCodes, equiPairs
+
+# Relationship scoring.
+# A submission relationship is credited when its source and its target were both
+# matched to gold spans, and gold has the same relationship between those two spans in
+# the gold annotSet the submission set was aligned with. All three relationship types
+# are resolved in one pass:
+# - the span matches of every type make up a single map from a submission span
+#   (docId, annotSet, annotId) to the gold annotId it was matched to,
+# - the source and target of every submission relationship are looked up in that map,
+#   each only among the span types its relationship type allows,
+# - every resolved (source, target) edge is matched against the gold relationships,
+#   and whatever is left on either side is sub only or gold only.
+# Rows come out in the order the three chained joins per relationship type used to
+# produce them, so every score is the same.
+
+# The span match tables, in the order their rows are tried as endpoints
+SPAN_TYPES = ["MeasuredEntity", "MeasuredProperty", "Quantity", "Qualifier"]
+
+# The span types each relationship type may start from and point to
+ENDPOINTS = {
+    "HasQuantity": (["MeasuredEntity", "MeasuredProperty"], ["Quantity"]),
+    "HasProperty": (["MeasuredEntity"], ["MeasuredProperty"]),
+    "Qualifies": (["Qualifier"], ["MeasuredEntity", "MeasuredProperty", "Quantity"]),
+}
+REL_TYPES = list(ENDPOINTS)
+
+MATCH_KEYS = ["docId", "annotSet", "annotId", "gAnnotId"]
+
+
+def allowedTypes(end):
+    """ Which span types (columns) each relationship type (rows) allows at one end, 0 for the source and 1 for the target """
+    return np.array([[spanType in ENDPOINTS[relType][end] for spanType in SPAN_TYPES] for relType in REL_TYPES])
+
+
+def relTypeCodes(rels):
+    """ Position of each row's relType in REL_TYPES, -1 for any other """
+    return pd.Index(REL_TYPES).get_indexer(rels["relType"].to_numpy(dtype=object))
+
+
+def endpointPairs(rels, column, spans, allowed):
+    """ (relationship, span match) position pairs where the span named in column was matched, with a type allowed there """
+    lKeys, rKeys = keyCodes(rels, spans, ["docId", "annotSet", column], ["docId", "annotSet", "annotId"])
+    li, ri = equiPairs(lKeys, rKeys)
+    relCodes = relTypeCodes(rels)[li]
+    keep = (relCodes >= 0) & allowed[np.maximum(relCodes, 0), spans["spanType"].to_numpy()[ri]]
+    return li[keep], ri[keep]
+
+
+def unmatched(frame, columns, matches, matchColumns):
+    """ Rows of frame whose columns appear in no row of matches' matchColumns """
+    lKeys, rKeys = keyCodes(frame, matches, columns, matchColumns)
+    return frame[(lKeys < 0) | ~np.isin(lKeys, rKeys)]
+
+
+def resolveRelations(subRels, goldRels, spanMatches):
+    """ Matched, sub only, and gold only relationships of each type in REL_TYPES
+
+    spanMatches gives the match frame of each of SPAN_TYPES. Returns a dict of
+    relType: (matches, subOnly, goldOnly).
+    """
+    # One map from submission spans to the gold spans they were matched to
+    spans = pd.concat([spanMatches[spanType][MATCH_KEYS].assign(spanType=i) for i, spanType in enumerate(SPAN_TYPES)], ignore_index=True)
+
+    # Every source match of a relationship with every target match of the same relationship
+    sLi, sRi = endpointPairs(subRels, "src", spans, allowedTypes(0))
+    tLi, tRi = endpointPairs(subRels, "target", spans, allowedTypes(1))
+    a, b = equiPairs(sLi, tLi)
+    gAnnotIds = spans["gAnnotId"].to_numpy(dtype=object)
+    edges = subRels.iloc[sLi[a]].reset_index(drop=True)
+    edges["gSrc"] = gAnnotIds[sRi[a]]
+    edges["gTarget"] = gAnnotIds[tRi[b]]
+
+    # Edges that gold has too, in its annotSet
+    lKeys, rKeys = keyCodes(edges, goldRels, ["docId", "gAnnotSet", "relType", "gSrc", "gTarget"],
+                            ["docId", "annotSet", "relType", "src", "target"])
+    mi, _ = equiPairs(lKeys, rKeys)
+    matches = edges.iloc[mi].reset_index(drop=True)
+    # EM and F1 here are both binary (no partial overlap matches)
+    matches["EM"] = 1.0
+    matches["F1"] = None
+
+    # A source credited with a relationship of a type isn't also sub only (or gold only) for it
+    subOnly = unmatched(subRels, ["docId", "annotSet", "relType", "src"], matches, ["docId", "annotSet", "relType", "src"])
+    goldOnly = unmatched(goldRels, ["docId", "annotSet", "relType", "src"], matches, ["docId", "gAnnotSet", "relType", "gSrc"])
+
+    resolved = {}
+    for relType in REL_TYPES:
+        resolved[relType] = tuple(frame[(frame["relType"] == relType).to_numpy()].reset_index(drop=True)
+                                  for frame in (matches, subOnly, goldOnly))
+    return resolved
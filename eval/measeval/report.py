@@ -0,0 +1,243 @@
+import json
+import numpy as np
+import pandas as pd
+
+CLASSES = ["Quantity", "MeasuredEntity", "MeasuredProperty", "Qualifier",
+           "Unit", "modifier", "HasQuantity", "HasProperty", "Qualifies"]
+
+SUBJECTS = ["Agriculture", "Astronomy", "Biology", "Chemistry",
+            "Computer Science", "Earth Science", "Engineering",
+            "Materials Science", "Mathematics", "Medicine"]
+
+# Modes in which this scoring is run, which determine how averages are calculated.
+# The default is "overall", which averages everything.
+# The overall F1 is the score used on the leaderboard.
+MODES = ["overall", "class", "sub", "doc", "classdoc"]
+MODE_ALIASES = {"subject": "sub", "both": "classdoc"}
+
+
+def canonicalMode(mode):
+    """ Maps a mode name or alias onto one of MODES """
+    mode = MODE_ALIASES.get(mode, mode)
+    if mode not in MODES:
+        raise ValueError("Unknown scoring mode: " + str(mode))
+    return mode
+
+
+# We count true positives, false positives, and false negatives
+# From the Match, Sub only, and Gold only sets.
+# We use this to determine a precision and recall, as well as an F-measure
+# Finally, we give the EM and Overlap score.
+def prf(rows):
+    """ Counts and averages for one slice of the score table """
+    tp = len(rows.loc[rows["matchType"] == "Match"].index)
+    fp = len(rows.loc[rows["matchType"] == "Sub only"].index)
+    fn = len(rows.loc[rows["matchType"] == "Gold only"].index)
+    result = {"tp": tp, "fp": fp, "fn": fn, "precision": None, "recall": None, "fmeasure": None}
+    if tp > 0:
+        precision = tp / (tp+fp)
+        recall = tp / (tp + fn)
+        result["precision"] = precision
+        result["recall"] = recall
+        result["fmeasure"] = (2 * precision * recall) / (precision + recall)
+    result.update(averages(rows))
+    return result
+
+
+def averages(rows):
+    """ Exact Match and F1 (Overlap) averages for one slice of the score table """
+    return {"EM": float(rows["EM"].mean()), "F1": float(rows["F1"].mean())}
+
+
+# Every mode is a grouping of the score table rows: by nothing (overall), by class,
+# by subject, by docId, or by docId and class. All of them are computed from one
+# stable sort of the table per grouping rather than a boolean mask per group.
+# Within each group the rows keep their table order, and each average is the sum of
+# that contiguous slice over its count, which is exactly what Series.mean computes
+# on a masked selection, so every score is bit for bit what masking gives.
+MATCH_TYPES = ["Match", "Sub only", "Gold only"]
+GROUP_COLUMNS = {"overall": [], "class": ["type"], "sub": ["subject"], "doc": ["docId"], "classdoc": ["docId", "type"]}
+
+
+def groupLevels(wrk1score, column):
+    """ The groups of a column in the order its breakdown lists them """
+    if column == "type":
+        return CLASSES
+    if column == "subject":
+        return SUBJECTS
+    return list(wrk1score[column].unique())
+
+
+def groupScores(wrk1score, columns):
+    """ prf for every combination of the levels of columns (see groupLevels), keyed by tuples of levels """
+    levels = [groupLevels(wrk1score, col) for col in columns]
+    shape = tuple(len(level) for level in levels)
+    nGroups = int(np.prod(shape)) if shape else 1
+    if columns:
+        codes = [pd.Index(level).get_indexer(wrk1score[col]) for level, col in zip(levels, columns)]
+        keep = np.logical_and.reduce([code >= 0 for code in codes])
+        groups = np.ravel_multi_index([code[keep] for code in codes], shape) if keep.any() else np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(keep)
+    else:
+        groups = np.zeros(len(wrk1score), dtype=np.int64)
+        rows = np.arange(len(wrk1score))
+    order = np.argsort(groups, kind="stable")
+    rows, groups = rows[order], groups[order]
+    bounds = np.searchsorted(groups, np.arange(nGroups + 1))
+
+    matchType = wrk1score["matchType"].to_numpy()[rows]
+    counts = dict((m, np.bincount(groups[matchType == m], minlength=nGroups)) for m in MATCH_TYPES)
+    means = {}
+    for metric in ["EM", "F1"]:
+        values = wrk1score[metric].to_numpy(dtype=np.float64)[rows]
+        # Like Series.mean, missing values are summed as 0 and left out of the count
+        missing = np.isnan(values)
+        values = np.where(missing, 0.0, values)
+        present = np.bincount(groups[~missing], minlength=nGroups)
+        means[metric] = [values[bounds[g]:bounds[g + 1]].sum() / present[g] if present[g] else np.nan for g in range(nGroups)]
+
+    result = {}
+    for g, key in enumerate(np.ndindex(*shape) if shape else [()]):
+        tp, fp, fn = (int(counts[m][g]) for m in MATCH_TYPES)
+        scores = {"tp": tp, "fp": fp, "fn": fn, "precision": None, "recall": None, "fmeasure": None}
+        if tp > 0:
+            precision = tp / (tp+fp)
+            recall = tp / (tp + fn)
+            scores["precision"] = precision
+            scores["recall"] = recall
+            scores["fmeasure"] = (2 * precision * recall) / (precision + recall)
+        scores["EM"] = float(means["EM"][g])
+        scores["F1"] = float(means["F1"][g])
+        result[tuple(level[i] for level, i in zip(levels, key))] = scores
+    return result
+
+
+def summarizeAll(wrk1score, modes=MODES):
+    """ Structured scores for the score table in every given mode, each from one grouped pass """
+    results = {}
+    for mode in modes:
+        mode = canonicalMode(mode)
+        scores = groupScores(wrk1score, GROUP_COLUMNS[mode])
+        if mode == "overall":
+            results[mode] = scores[()]
+        elif mode == "class" or mode == "sub":
+            results[mode] = dict((key[0], value) for key, value in scores.items())
+        # Per paragraph, only the averages are given
+        elif mode == "doc":
+            results[mode] = dict((key[0], averagesOf(value)) for key, value in scores.items())
+        elif mode == "classdoc":
+            result = {}
+            for (docid, annotType), value in scores.items():
+                result.setdefault(docid, {})[annotType] = averagesOf(value)
+            results[mode] = result
+    return results
+
+
+def averagesOf(scores):
+    """ Just the Exact Match and F1 (Overlap) averages of a prf result """
+    return {"EM": scores["EM"], "F1": scores["F1"]}
+
+
+def summarize(wrk1score, mode="overall"):
+    """ Structured scores for the score table in the given mode """
+    mode = canonicalMode(mode)
+    return summarizeAll(wrk1score, [mode])[mode]
+
+
+def breakdownRows(results):
+    """ One flat row per group of every breakdown in a summarizeAll result """
+    rows = []
+    for mode, result in results.items():
+        if mode == "overall":
+            rows.append(dict({"mode": mode}, **result))
+        elif mode == "class":
+            rows.extend(dict({"mode": mode, "type": label}, **scores) for label, scores in result.items())
+        elif mode == "sub":
+            rows.extend(dict({"mode": mode, "subject": label}, **scores) for label, scores in result.items())
+        elif mode == "doc":
+            rows.extend(dict({"mode": mode, "docId": docid}, **scores) for docid, scores in result.items())
+        elif mode == "classdoc":
+            for docid, classes in result.items():
+                rows.extend(dict({"mode": mode, "docId": docid, "type": annotType}, **scores) for annotType, scores in classes.items())
+    return rows
+
+
+def writeBreakdowns(results, path):
+    """ Writes a summarizeAll result as json, or as csv with one row per group if path ends with .csv """
+    if path.endswith(".csv"):
+        columns = ["mode", "docId", "type", "subject", "tp", "fp", "fn", "precision", "recall", "fmeasure", "EM", "F1"]
+        rows = pd.DataFrame(breakdownRows(results), columns=columns)
+        # Per paragraph rows have no counts, which would otherwise turn every count into a float
+        rows[["tp", "fp", "fn"]] = rows[["tp", "fp", "fn"]].astype("Int64")
+        rows.to_csv(path, index=False)
+    else:
+        with open(path, "w") as f:
+            json.dump(jsonSafe(results), f, indent=2)
+
+
+def jsonSafe(value):
+    """ value with every NaN (the average of a group with no rows) replaced by None, which json has a null for """
+    if isinstance(value, dict):
+        return dict((k, jsonSafe(v)) for k, v in value.items())
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def printPrf(result, label=""):
+    """ Prints counts and averages in the format used by the per class and per subject modes """
+    suffix = " for " + label if label else ""
+    if result["tp"]+result["fp"] == 0:
+        print("Submission has no data" + suffix)
+        print("")
+    elif result["tp"] == 0:
+        print("Submission has no matches against gold data" + suffix)
+    else:
+        print("True positives (matching rows)" + suffix + ": " + str(result["tp"]))
+        print("False positives (submission only)" + suffix + ": " + str(result["fp"]))
+        print("False negatives (gold only)" + suffix + ": " + str(result["fn"]))
+        print("")
+        print("Precision" + suffix + ": " + str(result["precision"]))
+        print("Recall" + suffix + ": " + str(result["recall"]))
+        print("F-measure" + suffix + ": " + str(result["fmeasure"]))
+        print("")
+
+
+def printSummary(result, mode="overall"):
+    """ Prints a structured summary the way the evaluation script always has """
+    mode = canonicalMode(mode)
+    if mode == "overall":
+        print("True positives (matching rows): " + str(result["tp"]))
+        print("False positives (submission only): " + str(result["fp"]))
+        print("False negatives (gold only): " + str(result["fn"]))
+        print("")
+        if result["tp"]+result["fp"] == 0:
+            print("Submission has no data.")
+            print("")
+        elif result["tp"] == 0:
+            print("Submission has no matches against gold data")
+        else:
+            print("Precision: " + str(result["precision"]))
+            print("Recall: " + str(result["recall"]))
+            print("F-measure: " + str(result["fmeasure"]))
+            print("")
+
+        print("Overall Score Exact Match: " + str(result["EM"]))
+        print("Overall Score F1 (Overlap): " + str(result["F1"]))
+    elif mode == "class" or mode == "sub":
+        for label, scores in result.items():
+            print("Processing " + label)
+            printPrf(scores, label)
+            print("Exact Match Score for " + label + ": " + str(scores["EM"]))
+            print("F1 (Overlap) Score for " + label + ": " + str(scores["F1"]))
+            print("")
+    elif mode == "doc":
+        for docid, scores in result.items():
+            print("Exact Match Score for " + docid + ": " + str(scores["EM"]))
+            print("F1 (Overlap) Score for " + docid + ": " + str(scores["F1"]))
+    elif mode == "classdoc":
+        for docid, classes in result.items():
+            for annotType, scores in classes.items():
+                print("Exact Match Score for " + docid + " for " + annotType + ": " + str(scores["EM"]))
+                print("F1 (Overlap) Score for " + docid + " for " + annotType + ": " + str(scores["F1"]))
+                print("")
@@ -0,0 +1,760 @@
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pandasql import sqldf
+
+from .corpus import prepareFrame, decodeOther, ofType, explodeMods
+from .intervals import overlapJoin, selectPairs
+from .matching import oneToOne
+from .relations import resolveRelations
+from .units import canonicalUnits
+from .profiling import stage, lap
+from .report import CLASSES, SUBJECTS, MATCH_TYPES, summarizeAll
+
+# For a SQuAD-style "F1" overlap score
+# we calculate token level overlap between the submission and gold endpoints
+# Tokenization is done using a simple space delimited method, so a span's
+# token count is its number of spaces plus one.
+def countSpaces(texts, starts=None, ends=None):
+    """ Number of spaces in each text, or in each text[start:end] if bounds are given """
+    texts = [str(t) for t in texts]
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    # Running count of spaces across all texts laid end to end
+    chars = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    spaces = np.concatenate([[0], np.cumsum(chars == 32)])
+    if starts is None:
+        starts = np.zeros(len(texts), dtype=np.int64)
+        ends = lengths
+    # Clip the bounds the same way string slicing would
+    starts = np.clip(starts, 0, lengths)
+    ends = np.clip(ends, starts, lengths)
+    return spaces[offsets[:-1] + ends] - spaces[offsets[:-1] + starts]
+
+
+def calcF1 (matches, tokens=None):
+    """ Token overlap F1 for every row of a frame of matched spans (aStart, aEnd, aText, gStart, gEnd, gText)
+
+    With a TokenIndex (and a docId column), tokens are those of the paragraph text
+    instead, see measeval/tokens.py.
+    """
+    if tokens is not None:
+        return indexedF1(matches, tokens)
+    aStart = matches["aStart"].to_numpy(dtype=np.int64)
+    aEnd = matches["aEnd"].to_numpy(dtype=np.int64)
+    gStart = matches["gStart"].to_numpy(dtype=np.int64)
+    gEnd = matches["gEnd"].to_numpy(dtype=np.int64)
+    aTokensSize = countSpaces(matches["aText"]) + 1
+    gTokensSize = countSpaces(matches["gText"]) + 1
+    overlapStart = np.maximum(aStart, gStart)
+    overlapEnd = np.minimum(aEnd, gEnd)
+    overlapSubStrStart = np.where(overlapStart > aStart, overlapStart - aStart, 0)
+    overlapSubStrLen = overlapEnd - overlapStart
+    overlapTokenCnt = countSpaces(matches["aText"], overlapSubStrStart, overlapSubStrStart + overlapSubStrLen) + 1
+
+    precision = 1.0 * overlapTokenCnt / aTokensSize
+    recall = 1.0 * overlapTokenCnt / gTokensSize
+
+    F1 = (2 * precision * recall) / (precision + recall)
+    return F1
+
+
+def indexedF1(matches, tokens):
+    """ Token overlap F1 for every row of a frame of matched spans, with the tokens of a TokenIndex """
+    docIds = matches["docId"].to_numpy(dtype=object)
+    aStart = matches["aStart"].to_numpy(dtype=np.int64)
+    aEnd = matches["aEnd"].to_numpy(dtype=np.int64)
+    gStart = matches["gStart"].to_numpy(dtype=np.int64)
+    gEnd = matches["gEnd"].to_numpy(dtype=np.int64)
+    aTokensSize = tokens.count(docIds, aStart, aEnd)
+    gTokensSize = tokens.count(docIds, gStart, gEnd)
+    overlapTokenCnt = tokens.count(docIds, np.maximum(aStart, gStart), np.minimum(aEnd, gEnd))
+
+    # Spans that share no token (or have none) score 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = 1.0 * overlapTokenCnt / aTokensSize
+        recall = 1.0 * overlapTokenCnt / gTokensSize
+        F1 = (2 * precision * recall) / (precision + recall)
+    return np.where(overlapTokenCnt > 0, F1, 0.0)
+
+
+def exactMatch(matches):
+    """ 1.0 where submission and gold offsets align exactly, otherwise 0 """
+    return np.where((matches["aStart"] == matches["gStart"]) & (matches["aEnd"] == matches["gEnd"]), 1.0, 0)
+
+
+
+# Every frame produced by the alignment, in the order they make up the score table.
+# Each entry gives the column holding the row type and the column holding its F1 score.
+SCORE_FRAMES = [
+    ("quantityMatches", "annotType", "maxF1"),
+    ("subOnlyQuants", "annotType", "F1"),
+    ("goldOnlyQuants", "annotType", "F1"),
+    ("unitMatches", "annotType", "F1"),
+    ("subOnlyUnits", "annotType", "F1"),
+    ("goldOnlyUnits", "annotType", "F1"),
+    ("entityMatches", "annotType", "maxF1"),
+    ("subOnlyEntities", "annotType", "F1"),
+    ("goldOnlyEntities", "annotType", "F1"),
+    ("propertyMatches", "annotType", "maxF1"),
+    ("subOnlyProperties", "annotType", "F1"),
+    ("goldOnlyProperties", "annotType", "F1"),
+    ("qualifierMatches", "annotType", "maxF1"),
+    ("subOnlyQualifiers", "annotType", "F1"),
+    ("goldOnlyQualifiers", "annotType", "F1"),
+    ("hasQuantMatch", "relType", "F1"),
+    ("subOnlyHasQuant", "relType", "F1"),
+    ("goldOnlyHasQuant", "relType", "F1"),
+    ("hasPropMatch", "relType", "F1"),
+    ("subOnlyHasProp", "relType", "F1"),
+    ("goldOnlyHasProp", "relType", "F1"),
+    ("qualifiesMatch", "relType", "F1"),
+    ("subOnlyQualifies", "relType", "F1"),
+    ("goldOnlyQualifies", "relType", "F1"),
+    ("modsMatches", "relType", "F1"),
+    ("subOnlyMods", "relType", "F1"),
+    ("goldOnlyMods", "relType", "F1"),
+]
+
+
+# How submission Quantities are aligned with gold ones: "all" credits every
+# overlapping pair, as the CodaLab scorer does; "optimal" keeps a maximum weight
+# one-to-one matching of them per document.
+ALIGNMENTS = ["all", "optimal"]
+# How units are compared: "strict" as the exact strings, as the CodaLab scorer does;
+# "canonical" as their canonical forms, so spelling variants match.
+UNIT_MODES = ["strict", "canonical"]
+
+
+def align(gold, sub, alignment="all", units="strict", tokens=None):
+    """ Aligns a submission frame against a GoldCorpus, returning every match, sub only, and gold only frame by name
+
+    F1 (Overlap) counts the tokens of the span texts, or those of the paragraph
+    texts if a TokenIndex is given (see calcF1).
+    """
+    if alignment not in ALIGNMENTS:
+        raise ValueError("Unknown alignment {!r}; expected one of {}".format(alignment, ", ".join(ALIGNMENTS)))
+    if units not in UNIT_MODES:
+        raise ValueError("Unknown units {!r}; expected one of {}".format(units, ", ".join(UNIT_MODES)))
+    sub = prepareFrame(sub)
+    if "relType" not in sub.columns:
+        sub = decodeOther(sub)
+    lap("prepare", sub)
+    goldQuants = gold.quants
+    goldUnits = gold.units
+    goldEntities = gold.entities
+    goldProperties = gold.properties
+    goldQualifiers = gold.qualifiers
+    goldRels = gold.rels
+    goldMods = gold.mods
+
+    # Start processing quantities
+    subQuants = ofType(sub, "Quantity")
+
+    # pandasql to get our matches for Quantity
+
+    # Note that we are processing everything keyed on Quantities.
+    # Any even partially matched quantity will be marked as a match
+    # All other components will only be credited if associated with a matching quantity
+    # So if a submission has identified the MeasuredEntity spans correctly
+    # but has them assocaited with incorrectly matched quantities
+    # credit will not be given for those matches.
+
+    # Matching here is done in two steps.
+    # matching quantities in the submission file are given appropriate
+    # annotSet and annotId values drawn from teh matching gold data
+
+    # Each join is followed by a lap, so --profile can show which of them the time and memory went to.
+
+    # Overlap is tested with the interval join in measeval/intervals.py
+    # rather than a theta join, which SQLite can't index.
+    li, ri = overlapJoin(subQuants, goldQuants, ["docId"], ["docId"])
+    # With one-to-one alignment, each Quantity keeps at most one of the pairs it is in,
+    # chosen by a maximum weight matching on overlap F1 (see measeval/matching.py).
+    if alignment == "optimal":
+        candidates = selectPairs(subQuants, goldQuants, li, ri,
+            """s.docId, s.startOffset as aStart, s.endOffset as aEnd, s.text as aText,
+               g.startOffset as gStart, g.endOffset as gEnd, g.text as gText""")
+        keep = oneToOne(candidates["docId"].to_numpy(), li, ri, calcF1(candidates, tokens))
+        li, ri = li[keep], ri[keep]
+        lap("oneToOne", candidates[keep], candidates)
+    subMatches = selectPairs(subQuants, goldQuants, li, ri,
+        """s.annotSet, g.annotSet as gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset, s.endOffset, s.text, s.EM, s.F1, s.maxF1""")
+
+    # Those matching annotSet and annotId values are then used to build a joined dataset
+    # Joins list submission rows in order, so the score table comes out the same however
+    # SQLite plans the join (and however the documents are sharded, see parallelScoreTable).
+
+    q = """SELECT
+            l.annotSet, l.gAnnotSet, l.docId, l.annotId, l.gAnnotId,
+            l.startOffset as aStart, l.endOffset as aEnd, l.text as aText,
+            r.startOffset as gStart, r.endOffset as gEnd, r.text as gText,
+            l.EM, l.F1, l.maxF1
+         FROM
+            subMatches l
+         JOIN
+            goldQuants r
+               ON (l.docId = r.docId
+               AND l.gAnnotSet = r.annotSet
+               AND l.gAnnotId = r.annotId)
+         ORDER BY l.rowid, r.rowid"""
+
+    quantityMatches = sqldf(q, locals())
+
+    # within the joined dataset, exact match (EM) scores are assigned if the
+    # submission and gold start and end offsets align exactly.
+
+    quantityMatches['EM'] = exactMatch(quantityMatches)
+
+    quantityMatches['F1'] = calcF1(quantityMatches, tokens)
+
+    # If there are multiple matches, we will give the highest F1 score.
+    # (With one-to-one alignment there never are, so maxF1 is simply F1.)
+    quantityMatches['maxF1'] = quantityMatches.groupby(['docId', 'annotId'], observed=True)['F1'].transform('max')
+    lap("quantityMatches", quantityMatches, [subQuants, goldQuants])
+
+    # We also create sets of submission only Quantities and Gold Only Quantiites
+    # These will be scored as both EM and F1 = 0 in the final evaluation,
+    # so that precision and recall impact the overall score.
+
+    q = """SELECT
+            l.*
+         FROM
+            subQuants l
+         LEFT JOIN
+            quantityMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.annotSet
+               AND l.annotId = r.annotId)
+               WHERE r.docId is NULL"""
+
+    subOnlyQuants = sqldf(q, locals())
+    lap("subOnlyQuants", subOnlyQuants, [subQuants, quantityMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldQuants l
+         LEFT JOIN
+            quantityMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet
+               AND l.annotId = r.gAnnotId)
+               WHERE r.docId is NULL"""
+
+    goldOnlyQuants = sqldf(q, locals())
+    lap("goldOnlyQuants", goldOnlyQuants, [goldQuants, quantityMatches])
+
+    # Next, we collect those alignments from the quantity matches
+    # And propagate them through the rest of the submission.
+
+    # Note that (TODO) more than 1 submission value can match the same gold data
+    # and those scores will be duplicated. However, beyond the Quantity scores, only 1 gold datapoint
+    # can match a given submission annotSet. (TODO: Confirm that I'm not describing this backward.)
+
+    # Where a submission annotSet matches more than one gold annotSet, the last match wins.
+    annotSetAlignments = quantityMatches[["docId", "annotSet", "gAnnotSet"]].rename(columns={"gAnnotSet":"matchAnnotSet"})
+    annotSetAlignments = annotSetAlignments.drop_duplicates(["docId", "annotSet"], keep="last")
+
+    # Update submission data with corresponding gold annotSet if applicable.
+    sub["gAnnotSet"] = sub[["docId", "annotSet"]].merge(annotSetAlignments, how="left", on=["docId", "annotSet"])["matchAnnotSet"].to_numpy()
+    lap("annotSetAlignments", annotSetAlignments, quantityMatches)
+
+    # Now we'll process our units
+    # These were unpacked from the json in the other column when the data was loaded
+
+    subUnits = sub[(sub["annotType"] == "Quantity") & sub.other.notnull()]
+    subUnits = subUnits[subUnits.unit != ""][["docId", "annotSet", "gAnnotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "unit", "EM", "F1", "maxF1"]]
+
+    # With canonical units, spelling variants of the same unit ("µm" and "μm", "mg L−1"
+    # and "mg/L") match through their canonical forms (see measeval/units.py).
+    unitKey = "unit"
+    if units == "canonical":
+        subUnits = subUnits.assign(unitKey=canonicalUnits(subUnits["unit"]))
+        goldUnits = goldUnits.assign(unitKey=canonicalUnits(goldUnits["unit"]))
+        unitKey = "unitKey"
+        lap("canonicalUnits", [subUnits, goldUnits])
+
+    # We'll now use our same matching strategy to score units,
+    # ensuring that the text of the unit matches.
+    q = """SELECT
+           s.gAnnotSet as matchAnnotSet, s.annotSet, g.annotSet as gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset, s.endOffset, s.text as sText, g.text as gText,
+           s.unit as sUnit, g.unit as gUnit, s.{key} as sKey, g.{key} as gKey, s.EM, s.F1, s.maxF1
+         FROM
+            subUnits s
+         JOIN
+            goldUnits g
+               ON (s.docId = g.docId
+               AND s.gAnnotSet = g.annotSet
+               AND s.{key} = g.{key})
+         ORDER BY s.rowid, g.rowid""".format(key=unitKey)
+    unitMatches = sqldf(q, locals())
+
+    # EM and F1 here are both binary (no partial overlap matches)
+    unitMatches['EM'] = np.where(unitMatches.sKey == unitMatches.gKey, 1.0, 0)
+    unitMatches['F1'] = np.where(unitMatches.sKey == unitMatches.gKey, 1.0, 0)
+    lap("unitMatches", unitMatches, [subUnits, goldUnits])
+
+    # And again, submission only and gold set only units
+    q = """SELECT
+            l.*
+         FROM
+            subUnits l
+         LEFT JOIN
+            unitMatches r
+               ON (l.docId = r.docId
+               AND l.gAnnotSet = r.gAnnotSet)
+               WHERE r.docId is NULL"""
+    subOnlyUnits = sqldf(q, locals())
+    lap("subOnlyUnits", subOnlyUnits, [subUnits, unitMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldUnits l
+         LEFT JOIN
+            unitMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet)
+               WHERE r.docId is NULL"""
+    goldOnlyUnits = sqldf(q, locals())
+    lap("goldOnlyUnits", goldOnlyUnits, [goldUnits, unitMatches])
+
+    # We do the same routine for MeasuredEntities
+    subEntities = ofType(sub, "MeasuredEntity")
+
+    li, ri = overlapJoin(subEntities, goldEntities, ["docId", "gAnnotSet"], ["docId", "annotSet"])
+    entityMatches = selectPairs(subEntities, goldEntities, li, ri,
+        """s.annotSet, s.gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset as aStart, g.startOffset as gStart,
+           s.endOffset as aEnd, g.endOffset as gEnd, s.text as aText, g.text as gText, s.other,
+           s.EM, s.F1, s.maxF1""")
+
+    entityMatches['EM'] = exactMatch(entityMatches)
+    entityMatches['F1'] = calcF1(entityMatches, tokens)
+    entityMatches['maxF1'] = entityMatches.groupby(['docId', 'annotId'], observed=True)['F1'].transform('max')
+    lap("entityMatches", entityMatches, [subEntities, goldEntities])
+
+    q = """SELECT
+            l.*
+         FROM
+            subEntities l
+         LEFT JOIN
+            entityMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.annotSet
+               AND l.annotId = r.annotId)
+               WHERE r.docId is NULL"""
+    subOnlyEntities = sqldf(q, locals())
+    lap("subOnlyEntities", subOnlyEntities, [subEntities, entityMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldEntities l
+         LEFT JOIN
+            entityMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet
+               AND l.annotId = r.gAnnotId)
+               WHERE r.docId is NULL"""
+    goldOnlyEntities = sqldf(q, locals())
+    lap("goldOnlyEntities", goldOnlyEntities, [goldEntities, entityMatches])
+
+    # We do the same routine for MeasuredProperties
+    subProperties = ofType(sub, "MeasuredProperty")
+
+    li, ri = overlapJoin(subProperties, goldProperties, ["docId", "gAnnotSet"], ["docId", "annotSet"])
+    propertyMatches = selectPairs(subProperties, goldProperties, li, ri,
+        """s.annotSet, s.gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset as aStart, g.startOffset as gStart,
+           s.endOffset as aEnd, g.endOffset as gEnd, s.text as aText, g.text as gText, s.other,
+           s.EM, s.F1, s.maxF1""")
+    propertyMatches['EM'] = exactMatch(propertyMatches)
+    propertyMatches['F1'] = calcF1(propertyMatches, tokens)
+    propertyMatches['maxF1'] = propertyMatches.groupby(['docId', 'annotId'], observed=True)['F1'].transform('max')
+    lap("propertyMatches", propertyMatches, [subProperties, goldProperties])
+
+    q = """SELECT
+            l.*
+         FROM
+            subProperties l
+         LEFT JOIN
+            propertyMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.annotSet
+               AND l.annotId = r.annotId)
+               WHERE r.docId is NULL"""
+    subOnlyProperties = sqldf(q, locals())
+    lap("subOnlyProperties", subOnlyProperties, [subProperties, propertyMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldProperties l
+         LEFT JOIN
+            propertyMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet
+               AND l.annotId = r.gAnnotId)
+               WHERE r.docId is NULL"""
+    goldOnlyProperties = sqldf(q, locals())
+    lap("goldOnlyProperties", goldOnlyProperties, [goldProperties, propertyMatches])
+
+    # We do the same routine for Qualifiers:
+    subQualifiers = ofType(sub, "Qualifier")
+
+    li, ri = overlapJoin(subQualifiers, goldQualifiers, ["docId", "gAnnotSet"], ["docId", "annotSet"])
+    qualifierMatches = selectPairs(subQualifiers, goldQualifiers, li, ri,
+        """s.annotSet, s.gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset as aStart, g.startOffset as gStart,
+           s.endOffset as aEnd, g.endOffset as gEnd, s.text as aText, g.text as gText, s.other,
+           s.EM, s.F1, s.maxF1""")
+    # qualifierMatches['EM'] = None
+    # qualifierMatches['F1'] = None
+    # qualifierMatches['maxF1'] = None
+
+    qualifierMatches['EM'] = exactMatch(qualifierMatches)
+    qualifierMatches['F1'] = calcF1(qualifierMatches, tokens)
+    qualifierMatches['maxF1'] = qualifierMatches.groupby(['docId', 'annotId'], observed=True)['F1'].transform('max')
+    lap("qualifierMatches", qualifierMatches, [subQualifiers, goldQualifiers])
+
+
+    q = """SELECT
+            l.*
+         FROM
+            subQualifiers l
+         LEFT JOIN
+            qualifierMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.annotSet
+               AND l.annotId = r.annotId)
+               WHERE r.docId is NULL"""
+    subOnlyQualifiers = sqldf(q, locals())
+    lap("subOnlyQualifiers", subOnlyQualifiers, [subQualifiers, qualifierMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldQualifiers l
+         LEFT JOIN
+            qualifierMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet
+               AND l.annotId = r.gAnnotId)
+               WHERE r.docId is NULL"""
+    goldOnlyQualifiers = sqldf(q, locals())
+    lap("goldOnlyQualifiers", goldOnlyQualifiers, [goldQualifiers, qualifierMatches])
+
+    # Now we will process and score all relationships.
+    # Relations are drawn from the "Other" column of the TSV data
+    # The "source" of a relationship is the annotation associated with a given row.
+    # It's relation type and "target" are established in the "other" field
+    # Our validation ensures that any annotation of type MeasuredEntity, MeasuredProperty, or Qualifier
+    # Includes the appropriate relationship.
+
+    # The relationships were pulled out of the json data when it was loaded:
+    tmpsRels = ofType(sub, ["MeasuredEntity", "MeasuredProperty", "Qualifier"]).rename(columns={"annotId": "src"})
+
+    subRels = tmpsRels[["docId", "annotSet", "gAnnotSet", "annotType", "relType", "src", "target"]]
+
+    # We process "HasQuantity", "HasProperty", and "Qualifies" together
+    # HasQuantity: source should be either a MeasuredEntity or a MeasuredProperty, target a Quantity
+    # HasProperty: always from a MeasuredEntity to a MeasuredProperty
+    # Qualifies: source is always a Qualifier, target can be any of entities, properties, or quantities
+    # TODO: We had some cases where a qualifier could qualify a qualifier
+    # Make sure these are gone. :)
+    # The corresponding gold set ids are looked up for every source and target endpoint
+    # in one map built from all of the span matches above, and the resolved relationships
+    # are scored against gold accordingly (see measeval/relations.py).
+    spanMatches = {"MeasuredEntity": entityMatches, "MeasuredProperty": propertyMatches,
+                   "Quantity": quantityMatches, "Qualifier": qualifierMatches}
+    relations = resolveRelations(subRels, goldRels, spanMatches)
+    hasQuantMatch, subOnlyHasQuant, goldOnlyHasQuant = relations["HasQuantity"]
+    hasPropMatch, subOnlyHasProp, goldOnlyHasProp = relations["HasProperty"]
+    qualifiesMatch, subOnlyQualifies, goldOnlyQualifies = relations["Qualifies"]
+    lap("relations", [frame for frames in relations.values() for frame in frames], [subRels, goldRels] + list(spanMatches.values()))
+
+    # Final component are our modifiers.
+    # there can be more than one modifier per Quantity
+    # These are the decoded mods lists, exploded to one row per modifier
+    subMods = explodeMods(sub[(sub["annotType"] == "Quantity") & sub.other.notnull()])[["docId", "annotSet", "gAnnotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "mods", "EM", "F1", "maxF1"]]
+
+    q = """SELECT
+           s.gAnnotSet as matchAnnotSet, s.annotSet, g.annotSet as gAnnotSet, s.docId, s.annotType, s.annotId,
+           g.annotId as gAnnotId, s.startOffset, s.endOffset, s.text as sText, g.text as gText,
+           s.mods as sMods, g.mods as gMods, s.EM, s.F1, s.maxF1
+         FROM
+            subMods s
+         JOIN
+            goldMods g
+               ON (s.docId = g.docId
+               AND s.gAnnotSet = g.annotSet
+               AND s.mods = g.mods)
+         ORDER BY s.rowid, g.rowid"""
+    modsMatches = sqldf(q, locals())
+    modsMatches['EM'] = 1.0
+    lap("modsMatches", modsMatches, [subMods, goldMods])
+
+    q = """SELECT
+            l.*
+         FROM
+            subMods l
+         LEFT JOIN
+            modsMatches r
+               ON (l.docId = r.docId
+               AND l.gAnnotSet = r.gAnnotSet
+               AND l.mods = r.sMods)
+               WHERE r.docId is NULL"""
+    subOnlyMods = sqldf(q, locals())
+    lap("subOnlyMods", subOnlyMods, [subMods, modsMatches])
+
+    q = """SELECT
+            l.*
+         FROM
+            goldMods l
+         LEFT JOIN
+            modsMatches r
+               ON (l.docId = r.docId
+               AND l.annotSet = r.gAnnotSet
+               AND l.mods = r.gMods)
+               WHERE r.docId is NULL"""
+    goldOnlyMods = sqldf(q, locals())
+    lap("goldOnlyMods", goldOnlyMods, [goldMods, modsMatches])
+
+    # Penalty is defined as 0
+    # This is where we apply the EM and F1 of 0 to all of our sub only and gold only results
+    # We will also apply annotTypes to data that don't already have one
+    # And we'll apply match types of "Match", "Gold only", and Sub only
+    # These match types allow us to calculate precision, recall, and F1 for teh overall scores
+    # Or at the document level or "class" level per the mode the evaluation script runs in.
+
+    penalty = 0
+
+    quantityMatches["annotType"] = "Quantity"
+    quantityMatches["matchType"] = "Match"
+    subOnlyQuants["EM"] = penalty
+    subOnlyQuants["F1"] = penalty
+    subOnlyQuants["matchType"] = "Sub only"
+    goldOnlyQuants["EM"] = penalty
+    goldOnlyQuants["F1"] = penalty
+    goldOnlyQuants["matchType"] = "Gold only"
+
+    unitMatches["annotType"] = "Unit"
+    unitMatches["matchType"] = "Match"
+    subOnlyUnits["annotType"] = "Unit"
+    goldOnlyUnits["annotType"] = "Unit"
+    subOnlyUnits["EM"] = penalty
+    subOnlyUnits["F1"] = penalty
+    subOnlyUnits["matchType"] = "Sub only"
+    goldOnlyUnits["EM"] = penalty
+    goldOnlyUnits["F1"] = penalty
+    goldOnlyUnits["matchType"] = "Gold only"
+
+    entityMatches["matchType"] = "Match"
+    subOnlyEntities["EM"] = penalty
+    subOnlyEntities["F1"] = penalty
+    subOnlyEntities["matchType"] = "Sub only"
+    goldOnlyEntities["EM"] = penalty
+    goldOnlyEntities["F1"] = penalty
+    goldOnlyEntities["matchType"] = "Gold only"
+
+    propertyMatches["matchType"] = "Match"
+    subOnlyProperties["EM"] = penalty
+    subOnlyProperties["F1"] = penalty
+    subOnlyProperties["matchType"] = "Sub only"
+    goldOnlyProperties["EM"] = penalty
+    goldOnlyProperties["F1"] = penalty
+    goldOnlyProperties["matchType"] = "Gold only"
+
+    qualifierMatches["matchType"] = "Match"
+    subOnlyQualifiers["EM"] = penalty
+    subOnlyQualifiers["F1"] = penalty
+    subOnlyQualifiers["matchType"] = "Sub only"
+    goldOnlyQualifiers["EM"] = penalty
+    goldOnlyQualifiers["F1"] = penalty
+    goldOnlyQualifiers["matchType"] = "Gold only"
+
+    hasQuantMatch["matchType"] = "Match"
+    hasQuantMatch["F1"] = hasQuantMatch["EM"]
+    subOnlyHasQuant["EM"] = penalty
+    subOnlyHasQuant["F1"] = penalty
+    subOnlyHasQuant["matchType"] = "Sub only"
+    goldOnlyHasQuant["EM"] = penalty
+    goldOnlyHasQuant["F1"] = penalty
+    goldOnlyHasQuant["matchType"] = "Gold only"
+
+    hasPropMatch["matchType"] = "Match"
+    hasPropMatch["F1"] = hasPropMatch["EM"]
+    subOnlyHasProp["EM"] = penalty
+    subOnlyHasProp["F1"] = penalty
+    subOnlyHasProp["matchType"] = "Sub only"
+    goldOnlyHasProp["EM"] = penalty
+    goldOnlyHasProp["F1"] = penalty
+    goldOnlyHasProp["matchType"] = "Gold only"
+
+    qualifiesMatch["matchType"] = "Match"
+    #print(qualifiesMatch)
+    qualifiesMatch["F1"] = qualifiesMatch["EM"]
+    subOnlyQualifies["EM"] = penalty
+    subOnlyQualifies["F1"] = penalty
+    subOnlyQualifies["matchType"] = "Sub only"
+    goldOnlyQualifies["EM"] = penalty
+    goldOnlyQualifies["F1"] = penalty
+    goldOnlyQualifies["matchType"] = "Gold only"
+
+    modsMatches["matchType"] = "Match"
+    modsMatches["F1"] = modsMatches["EM"]
+    subOnlyMods["EM"] = penalty
+    subOnlyMods["F1"] = penalty
+    subOnlyMods["matchType"] = "Sub only"
+    goldOnlyMods["EM"] = penalty
+    goldOnlyMods["F1"] = penalty
+    goldOnlyMods["matchType"] = "Gold only"
+    modsMatches["relType"] = "modifier"
+    subOnlyMods["relType"] = "modifier"
+    goldOnlyMods["relType"] = "modifier"
+
+    lap("penalties")
+    frames = locals()
+    return dict((name, frames[name]) for name, _, _ in SCORE_FRAMES)
+
+
+def scoreTable(frames, categories):
+    """ Builds the final per-row scoring dataframe from aligned frames """
+    # Concatenate the whole darn thing by building an array of these dataframes
+    # Selecting the fields we need, and renaming columns as needed.
+    wrk1array = []
+    for name, typeCol, f1Col in SCORE_FRAMES:
+        cols = ["docId", "matchType", typeCol, "EM", f1Col]
+        wrk1array.append(frames[name][cols].rename(columns={f1Col:"F1", typeCol:"type"}))
+
+    # Now we'll concatenate that into the final scoring dataframe.
+    wrk1score = compactScoreTable(pd.concat(wrk1array, ignore_index=True))
+    # The subject only depends on the docId, so it is looked up once per docId
+    docIds = wrk1score["docId"].cat.categories
+    subjects = pd.Series(docIds.str.split("-").str[0], index=docIds).map(categories)
+    wrk1score["subject"] = pd.Categorical(subjects.to_numpy()[wrk1score["docId"].cat.codes], categories=SUBJECTS)
+    return wrk1score
+
+
+# The score table can get large, so its labels are categoricals: docId with a
+# dictionary of its own, and type, matchType, and subject with fixed dictionaries
+# shared by every table (which keeps them categorical when tables are concatenated).
+def compactScoreTable(wrk1score):
+    """ The score table with categorical docId, type, and matchType """
+    wrk1score["docId"] = pd.Categorical(wrk1score["docId"].to_numpy(dtype=object))
+    types = wrk1score["type"].to_numpy(dtype=object)
+    # Any type outside CLASSES is kept rather than dropped, after the fixed ones
+    extra = sorted(set(types[~pd.isna(types)]) - set(CLASSES))
+    wrk1score["type"] = pd.Categorical(types, categories=CLASSES + extra)
+    wrk1score["matchType"] = pd.Categorical(wrk1score["matchType"].to_numpy(dtype=object), categories=MATCH_TYPES)
+    return wrk1score
+
+
+# Every join in the alignment is keyed on docId, so documents are independent
+# until the score table is averaged. With more than one job, we split the
+# documents into balanced shards and align each shard in its own process.
+
+def shardDocIds(gold, sub, jobs):
+    """ Splits the docIds of gold and submission into up to jobs shards of similar annotation counts """
+    # Largest documents first, each onto the least loaded shard
+    sizes = pd.concat([sub["docId"], gold.frame["docId"]], ignore_index=True).value_counts()
+    shards = [[] for _ in range(jobs)]
+    loads = [(0, i) for i in range(jobs)]
+    for docId, size in sizes.items():
+        load, i = heapq.heappop(loads)
+        shards[i].append(docId)
+        heapq.heappush(loads, (load + size, i))
+    return [shard for shard in shards if shard]
+
+
+def detailedScoreTable(frames, gold, sub):
+    """ scoreTable with the detail rows of measeval/analysis.py next to it """
+    from .analysis import detailRows
+    return pd.concat([scoreTable(frames, gold.categories), detailRows(frames, gold, sub)], axis=1)
+
+
+def shardScoreTable(gold, sub, alignment="all", units="strict", tokens=None, details=False):
+    """ Score table for one shard, with the position in SCORE_FRAMES each row came from """
+    frames = align(gold, sub, alignment, units, tokens)
+    wrk1score = detailedScoreTable(frames, gold, sub) if details else scoreTable(frames, gold.categories)
+    wrk1score["frame"] = np.repeat(np.arange(len(SCORE_FRAMES)), [len(frames[name]) for name, _, _ in SCORE_FRAMES])
+    return wrk1score
+
+
+def shardScoreTables(gold, sub, jobs, alignment="all", units="strict", tokens=None, details=False):
+    """ shardScoreTable for shards of documents aligned in a pool of worker processes, concatenated in no particular order """
+    shards = shardDocIds(gold, sub, jobs)
+    if len(shards) <= 1:
+        return shardScoreTable(gold, sub, alignment, units, tokens, details)
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [pool.submit(shardScoreTable, gold.restrict(shard), sub[sub["docId"].isin(shard)], alignment, units, tokens, details) for shard in shards]
+        return pd.concat([future.result() for future in futures], ignore_index=True)
+
+
+def orderScoreTable(wrk1score, gold, sub):
+    """ Puts rows from shardScoreTable(s) back in the order a single process would have produced """
+    # Averages only come out bit for bit the same in that order: by frame, then by the
+    # order documents appear in the side that drives that frame (gold for the gold
+    # only frames, the submission for everything else).
+    frame = wrk1score["frame"].to_numpy()
+    goldDriven = np.array([name.startswith("goldOnly") for name, _, _ in SCORE_FRAMES])
+    subRank = pd.Index(sub["docId"].unique()).get_indexer(wrk1score["docId"])
+    goldRank = pd.Index(gold.frame["docId"].unique()).get_indexer(wrk1score["docId"])
+    rank = np.where(goldDriven[frame], goldRank, subRank)
+    order = np.lexsort((rank, frame))
+    # Shards each have their own docId dictionary, so docId is only categorical again once they are recombined
+    return compactScoreTable(wrk1score.iloc[order].drop(columns=["frame"]).reset_index(drop=True))
+
+
+def parallelScoreTable(gold, sub, jobs, alignment="all", units="strict", tokens=None, details=False):
+    """ Builds the score table with shards of documents aligned in a pool of worker processes """
+    return orderScoreTable(shardScoreTables(gold, sub, jobs, alignment, units, tokens, details), gold, sub)
+
+
+# The columns of the score table itself; with details, they are followed by the detail rows
+SCORE_COLUMNS = ["docId", "matchType", "type", "EM", "F1", "subject"]
+# The columns the score table had before subject was added for the breakdowns
+BASE_COLUMNS = SCORE_COLUMNS[:5]
+
+
+def score(gold, sub, modes=("overall",), docIds=None, jobs=1, store=None, alignment="all", units="strict", tokens=None, details=False):
+    """ Scores a submission frame against a GoldCorpus
+
+    Returns a dict holding the per-row score table under "table" and the
+    structured summary for each requested mode under its canonical mode name.
+    If docIds is given, gold is limited to those paragraphs first. With jobs
+    above 1, documents are aligned in that many worker processes. With a
+    ScoreStore, only paragraphs that changed since its last run are aligned.
+    alignment is one of ALIGNMENTS and units one of UNIT_MODES; with a
+    TokenIndex, F1 (Overlap) counts the tokens of the paragraph texts.
+    With details, the score table with the submission and gold annotation
+    behind each row (see measeval/analysis.py) is also returned, as "details".
+    """
+    if details and store is not None:
+        raise ValueError("details need every paragraph aligned, so they can't come from a ScoreStore")
+    if docIds is not None:
+        gold = gold.restrict(docIds)
+    # With jobs above 1, documents are aligned in worker processes, so only the whole stage is profiled
+    with stage("align", [gold.frame, sub]) as record:
+        if store is not None:
+            wrk1score = store.scoreTable(gold, sub, jobs, alignment, units, tokens)
+        elif jobs > 1:
+            wrk1score = parallelScoreTable(gold, sub, jobs, alignment, units, tokens, details)
+        else:
+            frames = align(gold, sub, alignment, units, tokens)
+            wrk1score = detailedScoreTable(frames, gold, sub) if details else scoreTable(frames, gold.categories)
+            lap("scoreTable", wrk1score, list(frames.values()))
+        record["rowsOut"] = len(wrk1score)
+    results = {}
+    if details:
+        results["details"] = wrk1score
+        wrk1score = wrk1score[SCORE_COLUMNS]
+    results["table"] = wrk1score
+    with stage("summarize", wrk1score):
+        results.update(summarizeAll(wrk1score, modes))
+    return results
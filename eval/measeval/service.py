@@ -0,0 +1,334 @@
+import io
+import os
+import json
+import time
+import zlib
+import gzip
+import email
+import email.policy
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from .corpus import GoldCorpus, CATEGORIES_FILE
+from .cache import GoldCache
+from .leaderboard import SHARED, shareGold
+from .report import canonicalMode, jsonSafe
+from .scoring import score
+from .validation import validateDir
+
+# A long running scoring service.
+# The gold corpus is loaded and prepared once and kept in memory; submissions are
+# POSTed to /score as a zip or tar archive of .tsv files, a multipart form of .tsv
+# files, or a single .tsv file, and scored in a bounded pool of worker processes that
+# share the gold corpus the same way the leaderboard does (see leaderboard.py).
+# At most workers + queue submissions are accepted at once; past that the service
+# answers 503 with a Retry-After header rather than letting requests pile up.
+# The gold files are checked for changes every few seconds. A changed corpus is
+# loaded in the background and swapped in with a fresh pool; requests already running
+# finish against the corpus they started with.
+# GET /metrics gives request counts and latency histograms in the Prometheus text format.
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+# What reading a corrupt or truncated archive can raise
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, gzip.BadGzipFile, zlib.error, EOFError)
+ARCHIVE_TYPES = {"application/zip": "zip", "application/x-zip-compressed": "zip", "application/x-tar": "tar",
+                 "application/gzip": "tar", "application/x-gzip": "tar", "application/x-gtar": "tar"}
+
+
+def goldSignature(path, categories=CATEGORIES_FILE):
+    """ Names, sizes, and modification times of the gold files and categories, which change whenever their content does """
+    files = [path]
+    if os.path.isdir(path):
+        files = [os.path.join(path, fn) for fn in sorted(os.listdir(path)) if fn.endswith(".tsv")]
+    if isinstance(categories, str):
+        files.append(categories)
+    signature = []
+    for fn in files:
+        st = os.stat(fn)
+        signature.append((fn, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def safeName(name):
+    """ The file name part of an uploaded path, or None unless it is a .tsv file """
+    name = os.path.basename(name.replace("\\", "/"))
+    return name if name.endswith(".tsv") and not name.startswith(".") else None
+
+
+def unpackSubmission(body, contentType, directory, name=None):
+    """ Writes the .tsv files in a request body (an archive, a multipart form, or one file called name) to directory, returning their names """
+    mediaType = contentType.split(";")[0].strip().lower()
+    files = {}
+    if name is not None and mediaType not in ARCHIVE_TYPES and mediaType != "multipart/form-data":
+        if safeName(name) is None:
+            raise ValueError("name must be a .tsv file name")
+        files[safeName(name)] = body
+    elif mediaType in ARCHIVE_TYPES and ARCHIVE_TYPES[mediaType] == "zip" or body[:4] == b"PK\x03\x04":
+        try:
+            with zipfile.ZipFile(io.BytesIO(body)) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and safeName(info.filename):
+                        files[safeName(info.filename)] = archive.read(info)
+        except ARCHIVE_ERRORS as e:
+            raise ValueError("The submission is not a readable zip archive: " + str(e).splitlines()[0])
+    elif mediaType in ARCHIVE_TYPES or body[:2] == b"\x1f\x8b" or body[257:262] == b"ustar":
+        try:
+            with tarfile.open(fileobj=io.BytesIO(body), mode="r:*") as archive:
+                for member in archive.getmembers():
+                    if member.isfile() and safeName(member.name):
+                        files[safeName(member.name)] = archive.extractfile(member).read()
+        except ARCHIVE_ERRORS as e:
+            raise ValueError("The submission is not a readable tar archive: " + str(e).splitlines()[0])
+    elif mediaType == "multipart/form-data":
+        message = email.message_from_bytes(b"Content-Type: " + contentType.encode("latin-1") + b"\r\n\r\n" + body,
+                                           policy=email.policy.HTTP)
+        for part in message.iter_parts():
+            name = safeName(part.get_filename() or "")
+            if name:
+                files[name] = part.get_payload(decode=True)
+    else:
+        raise ValueError("Send a zip or tar archive of .tsv files, a multipart form of .tsv files, or one .tsv file with its name in ?name=")
+    if not files:
+        raise ValueError("The submission holds no .tsv files")
+    for name, data in files.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+    return list(files)
+
+
+def scoreSubmission(path, modes, limit):
+    """ Validates and scores a submission directory against the shared gold corpus, as plain data """
+    report = validateDir(path)
+    if report.badfiles:
+        return {"valid": False, "validation": report.toDict()}
+    docIds = [fn[:-4] for fn in report.names] if limit else None
+    results = score(SHARED["gold"], report.frame(), modes=modes, docIds=docIds)
+    scores = dict((mode, results[mode]) for mode in modes)
+    return jsonSafe({"valid": True, "files": len(report.names), "rows": len(results["table"]), "scores": scores})
+
+
+class Metrics(object):
+    """ Request counts and latency histograms, per endpoint and status """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.reloads = 0
+        self.rejected = 0
+
+    def observe(self, endpoint, status, seconds):
+        """ Counts one request and its latency """
+        with self.lock:
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets, total, count = self.latency.get(endpoint, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            buckets = [n + (seconds <= bound) for n, bound in zip(buckets, LATENCY_BUCKETS)]
+            self.latency[endpoint] = (buckets, total + seconds, count + 1)
+
+    def render(self, gauges):
+        """ Every metric in the Prometheus text format """
+        lines = ["# TYPE measeval_requests_total counter"]
+        with self.lock:
+            for (endpoint, status), n in sorted(self.requests.items()):
+                lines.append('measeval_requests_total{endpoint="%s",status="%d"} %d' % (endpoint, status, n))
+            lines.append("# TYPE measeval_request_seconds histogram")
+            for endpoint, (buckets, total, count) in sorted(self.latency.items()):
+                for bound, n in zip(LATENCY_BUCKETS, buckets):
+                    lines.append('measeval_request_seconds_bucket{endpoint="%s",le="%g"} %d' % (endpoint, bound, n))
+                lines.append('measeval_request_seconds_bucket{endpoint="%s",le="+Inf"} %d' % (endpoint, count))
+                lines.append('measeval_request_seconds_sum{endpoint="%s"} %f' % (endpoint, total))
+                lines.append('measeval_request_seconds_count{endpoint="%s"} %d' % (endpoint, count))
+            lines.append("# TYPE measeval_rejected_total counter")
+            lines.append("measeval_rejected_total %d" % self.rejected)
+            lines.append("# TYPE measeval_gold_reloads_total counter")
+            lines.append("measeval_gold_reloads_total %d" % self.reloads)
+        for name, value in gauges.items():
+            lines.append("# TYPE measeval_" + name + " gauge")
+            lines.append("measeval_%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+class ScoringService(object):
+    """ The gold corpus, worker pool, admission limit, and metrics behind the HTTP handler """
+
+    def __init__(self, path, workers=2, queue=8, reloadInterval=5.0, cache=None, categories=CATEGORIES_FILE, timeout=600):
+        self.path = path
+        self.workers = workers
+        self.capacity = workers + queue
+        self.timeout = timeout
+        self.cache = GoldCache(cache) if cache is not None else None
+        self.categories = categories
+        self.metrics = Metrics()
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.pool = None
+        self.gold = None
+        self.signature = None
+        self.loaded = None
+        self.stopping = threading.Event()
+        self.load()
+        self.watcher = None
+        if reloadInterval > 0:
+            self.watcher = threading.Thread(target=self.watch, args=(reloadInterval,), daemon=True)
+            self.watcher.start()
+
+    def makePool(self, gold):
+        """ A worker pool that scores against gold """
+        shareGold(gold)
+        if "fork" in multiprocessing.get_all_start_methods():
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=shareGold, initargs=(gold,))
+
+    def load(self):
+        """ Loads the gold corpus and swaps it in, with a new pool, if the files changed since the last load """
+        signature = goldSignature(self.path, self.categories)
+        if signature == self.signature:
+            return False
+        if self.cache is not None:
+            gold = self.cache.load(self.path, categories=self.categories)
+        else:
+            gold = GoldCorpus(self.path, categories=self.categories)
+        pool = self.makePool(gold)
+        with self.lock:
+            old, self.pool, self.gold = self.pool, pool, gold
+            self.signature, self.loaded = signature, time.time()
+        if old is not None:
+            # Submissions already handed to the old pool still finish
+            old.shutdown(wait=False)
+            with self.metrics.lock:
+                self.metrics.reloads += 1
+        return True
+
+    def watch(self, interval):
+        """ Reloads the gold corpus whenever its files change, until stopped """
+        while not self.stopping.wait(interval):
+            try:
+                self.load()
+            except Exception as e:
+                # A half written gold directory is picked up on a later check
+                print("Gold reload failed, still serving the previous corpus: " + repr(e))
+
+    def score(self, body, contentType, modes, limit, name=None):
+        """ Scores one submission, or returns None if the service is at capacity """
+        if not self.slots.acquire(blocking=False):
+            with self.metrics.lock:
+                self.metrics.rejected += 1
+            return None
+        directory = tempfile.mkdtemp(prefix="measeval-sub-")
+        with self.lock:
+            self.active += 1
+            pool = self.pool
+        future = None
+        try:
+            unpackSubmission(body, contentType, directory, name)
+            future = pool.submit(scoreSubmission, directory, modes, limit)
+        finally:
+            if future is None:
+                self.release(directory)
+        # A submission that times out keeps its slot and files until its worker is done with them
+        future.add_done_callback(lambda f: self.release(directory))
+        return future.result(timeout=self.timeout)
+
+    def release(self, directory):
+        """ Frees the admission slot and the files of a submission that is done """
+        shutil.rmtree(directory, ignore_errors=True)
+        with self.lock:
+            self.active -= 1
+        self.slots.release()
+
+    def status(self):
+        """ Gauges for /metrics and /health """
+        with self.lock:
+            return {"active_requests": self.active, "capacity": self.capacity, "workers": self.workers,
+                    "gold_files": len(self.gold.files), "gold_loaded_timestamp": self.loaded}
+
+    def close(self):
+        """ Stops watching the gold files and waits for running submissions """
+        self.stopping.set()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """ HTTP endpoints: POST /score, GET /metrics, GET /health """
+
+    service = None
+
+    def reply(self, status, body, contentType="application/json", headers={}):
+        """ Sends a response, json unless body is already text, and returns its status """
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        return status
+
+    def do_GET(self):
+        """ Metrics and health """
+        start = time.perf_counter()
+        endpoint = urlparse(self.path).path
+        if endpoint == "/metrics":
+            status = self.reply(200, self.service.metrics.render(self.service.status()), "text/plain; version=0.0.4")
+        elif endpoint == "/health":
+            status = self.reply(200, dict(self.service.status(), status="ok"))
+        else:
+            endpoint = "other"
+            status = self.reply(404, {"error": "Not found"})
+        self.service.metrics.observe(endpoint, status, time.perf_counter() - start)
+
+    def do_POST(self):
+        """ Scores a submission, with ?mode= (comma separated, overall by default) and ?limit=1 to limit gold as -l does """
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != "/score":
+            status = self.reply(404, {"error": "Not found"})
+            self.service.metrics.observe("other", status, time.perf_counter() - start)
+            return
+        query = parse_qs(url.query)
+        try:
+            modes = [canonicalMode(m) for m in ",".join(query.get("mode", ["overall"])).split(",") if m]
+            # As with -l, gold is limited to the submitted paragraphs only if asked
+            limit = query.get("limit", ["0"])[0].lower() in ["1", "true", "yes"]
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            result = self.service.score(body, self.headers.get("Content-Type", ""), modes, limit, query.get("name", [None])[0])
+            if result is None:
+                status = self.reply(503, {"error": "Too many submissions in progress, try again shortly"}, headers={"Retry-After": "1"})
+            else:
+                status = self.reply(200 if result["valid"] else 422, result)
+        except ValueError as e:
+            status = self.reply(400, {"error": str(e)})
+        except TimeoutError:
+            status = self.reply(504, {"error": "Scoring took longer than " + str(self.service.timeout) + " seconds"})
+        except Exception as e:
+            status = self.reply(500, {"error": repr(e)})
+        self.service.metrics.observe("/score", status, time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        # Requests are counted in /metrics rather than logged one per line
+        pass
+
+
+def serve(service, host="127.0.0.1", port=8000):
+    """ Serves a ScoringService over HTTP until interrupted """
+    handler = type("Handler", (ScoringHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from .report import prf
+
+# Confidence intervals and significance tests, resampling paragraphs.
+# Every score is a ratio of sums over the rows of the score table (EM and F1 are
+# sums over a row count, precision and recall are ratios of match counts), so a
+# resample only needs the per-paragraph sums, not the rows. A batch of resamples
+# is then one matrix product: how many times each paragraph was drawn, times the
+# per-paragraph sums.
+
+METRICS = ["precision", "recall", "fmeasure", "EM", "F1"]
+# Columns of the per-paragraph statistics
+STATS = ["rows", "EM", "F1", "tp", "fp", "fn"]
+# Resamples are drawn in blocks of at most this many paragraph draws, to bound memory
+BLOCK = 1 << 22
+
+
+def docStats(wrk1score, docIds=None):
+    """ The per-paragraph sums (see STATS) of a score table, one row per docId in docIds or in table order """
+    if docIds is None:
+        docIds = wrk1score["docId"].unique()
+    docIds = pd.Index(docIds)
+    codes = docIds.get_indexer(wrk1score["docId"])
+    keep = codes >= 0
+    codes = codes[keep]
+    matchType = wrk1score["matchType"].to_numpy()[keep]
+    columns = [np.ones(len(codes)), wrk1score["EM"].to_numpy(dtype=np.float64)[keep],
+               wrk1score["F1"].to_numpy(dtype=np.float64)[keep], matchType == "Match",
+               matchType == "Sub only", matchType == "Gold only"]
+    stats = np.zeros((len(docIds), len(STATS)))
+    for i, values in enumerate(columns):
+        stats[:, i] = np.bincount(codes, weights=values.astype(np.float64), minlength=len(docIds))
+    return docIds, stats
+
+
+def metrics(sums):
+    """ Each metric in METRICS from summed statistics, for a stack of sums in the last axis """
+    rows, em, f1, tp, fp, fn = np.moveaxis(sums, -1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp > 0, tp / (tp + fp), np.nan)
+        recall = np.where(tp > 0, tp / (tp + fn), np.nan)
+        return {"precision": precision,
+                "recall": recall,
+                "fmeasure": 2 * precision * recall / (precision + recall),
+                "EM": em / rows,
+                "F1": f1 / rows}
+
+
+def drawCounts(rng, nDocs, size):
+    """ How often each of nDocs paragraphs is drawn in size resamples of nDocs draws with replacement """
+    draws = rng.integers(0, nDocs, size=(size, nDocs))
+    draws += np.arange(size)[:, None] * nDocs
+    return np.bincount(draws.ravel(), minlength=size * nDocs).reshape(size, nDocs)
+
+
+def resampleSums(rng, stats, resamples):
+    """ Summed statistics of paragraph resamples, one row per resample, for one or more aligned stats arrays """
+    nDocs = len(stats[0])
+    block = max(1, BLOCK // max(nDocs, 1))
+    sums = [np.empty((resamples, len(STATS))) for _ in stats]
+    for start in range(0, resamples, block):
+        counts = drawCounts(rng, nDocs, min(block, resamples - start)).astype(np.float64)
+        for out, s in zip(sums, stats):
+            out[start:start + len(counts)] = counts @ s
+    return sums
+
+
+def interval(values, alpha):
+    """ The percentile interval covering 1 - alpha of the values """
+    low, high = np.nanpercentile(values, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
+
+
+def bootstrap(wrk1score, resamples=10000, alpha=0.05, seed=0):
+    """ Percentile bootstrap confidence intervals for each metric, resampling paragraphs """
+    rng = np.random.default_rng(seed)
+    _, stats = docStats(wrk1score)
+    point = prf(wrk1score)
+    sampled = metrics(resampleSums(rng, [stats], resamples)[0])
+    result = {}
+    for metric in METRICS:
+        low, high = interval(sampled[metric], alpha)
+        result[metric] = {"estimate": point[metric], "low": low, "high": high}
+    return result
+
+
+def difference(a, b):
+    """ b - a, or None if either is missing """
+    return None if a is None or b is None else b - a
+
+
+def pairedStats(tableA, tableB):
+    """ Per-paragraph statistics of two score tables over the same paragraphs (the union of both) """
+    docIds = pd.Index(tableA["docId"].unique()).union(pd.Index(tableB["docId"].unique()), sort=False)
+    return docStats(tableA, docIds)[1], docStats(tableB, docIds)[1]
+
+
+def pairedBootstrap(tableA, tableB, resamples=10000, alpha=0.05, seed=0):
+    """ Paired bootstrap of the difference B - A for each metric, resampling the same paragraphs for both
+
+    p is the two-sided p-value: twice the smaller share of resamples in which the
+    difference is at most or at least zero, with the same +1 correction as the
+    randomization test, so it is never 0.
+    """
+    rng = np.random.default_rng(seed)
+    statsA, statsB = pairedStats(tableA, tableB)
+    sumsA, sumsB = resampleSums(rng, [statsA, statsB], resamples)
+    pointA, pointB = prf(tableA), prf(tableB)
+    sampledA, sampledB = metrics(sumsA), metrics(sumsB)
+    result = {}
+    for metric in METRICS:
+        delta = sampledB[metric] - sampledA[metric]
+        delta = delta[~np.isnan(delta)]
+        low, high = interval(delta, alpha) if len(delta) else (np.nan, np.nan)
+        tail = min(np.sum(delta <= 0), np.sum(delta >= 0))
+        p = min(1.0, 2 * (tail + 1) / (len(delta) + 1)) if len(delta) else np.nan
+        result[metric] = {"A": pointA[metric], "B": pointB[metric], "delta": difference(pointA[metric], pointB[metric]),
+                          "low": low, "high": high, "p": float(p)}
+    return result
+
+
+def randomizationTest(tableA, tableB, trials=10000, seed=0):
+    """ Approximate randomization test of B against A for each metric, swapping whole paragraphs between them
+
+    p is the two-sided p-value, with the usual +1 correction.
+    """
+    rng = np.random.default_rng(seed)
+    statsA, statsB = pairedStats(tableA, tableB)
+    observedA, observedB = metrics(statsA.sum(axis=0)), metrics(statsB.sum(axis=0))
+    observed = dict((m, float(observedB[m] - observedA[m])) for m in METRICS)
+    pointA, pointB = prf(tableA), prf(tableB)
+    total = statsA.sum(axis=0) + statsB.sum(axis=0)
+    diff = statsB - statsA
+    block = max(1, BLOCK // max(len(diff), 1))
+    extreme = dict((m, 0) for m in METRICS)
+    for start in range(0, trials, block):
+        # Each paragraph's rows stay with A or move to B with probability one half
+        swaps = rng.integers(0, 2, size=(min(block, trials - start), len(diff))).astype(np.float64)
+        sumsA = statsA.sum(axis=0) + swaps @ diff
+        sampledA, sampledB = metrics(sumsA), metrics(total - sumsA)
+        for m in METRICS:
+            # Compare with a little slack so float noise doesn't decide ties
+            extreme[m] += int(np.sum(np.abs(sampledB[m] - sampledA[m]) >= abs(observed[m]) - 1e-12))
+    result = {}
+    for m in METRICS:
+        result[m] = {"A": pointA[m], "B": pointB[m], "delta": difference(pointA[m], pointB[m]), "p": (extreme[m] + 1) / (trials + 1)}
+    return result
+
+
+def printBootstrap(result, alpha=0.05):
+    """ Prints bootstrap confidence intervals """
+    print("Bootstrap " + str(round(100 * (1 - alpha), 2)) + "% confidence intervals, resampling paragraphs:")
+    for metric in METRICS:
+        scores = result[metric]
+        print("  " + metric + ": " + str(scores["estimate"]) + " [" + str(scores["low"]) + ", " + str(scores["high"]) + "]")
+
+
+def printComparison(result, test):
+    """ Prints a paired comparison of submissions A and B """
+    print("Paired " + test + " test of B against A:")
+    for metric in METRICS:
+        scores = result[metric]
+        line = "  " + metric + ": A " + str(scores["A"]) + ", B " + str(scores["B"]) + ", B - A " + str(scores["delta"])
+        if "low" in scores:
+            line += " [" + str(scores["low"]) + ", " + str(scores["high"]) + "]"
+        print(line + ", p = " + str(scores["p"]))
@@ -0,0 +1,176 @@
+import os
+import csv
+import json
+import numpy as np
+import pandas as pd
+
+from .corpus import loadTsvDir
+
+# Synthetic corpora for benchmarking, made by perturbing real annotations.
+# Every synthetic paragraph is a copy of a paragraph from a template set (the
+# training data by default) under a new docId of the same article, so subjects
+# still resolve. On top of that you can control:
+# - spans: the paragraph text is repeated this many times, with every annotation
+#   set repeated at the same place in each copy
+# - overlap: the share of annotation sets that get a second, slightly shifted set
+#   overlapping them
+# - fanout: how many extra Qualifiers point at each Quantity
+# A submission is then made from the synthetic gold by dropping, shifting, and
+# adding spans and by breaking units and relationships at the given rates.
+# Spans always hold the text of the paragraph at their offsets, so both sides pass validation.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "train")
+RAW_COLUMNS = ["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "other"]
+
+
+def ranges(starts, counts):
+    """ The concatenation of arange(start, start + count) for each start and count """
+    counts = np.asarray(counts)
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(np.asarray(starts), counts) + offsets
+
+
+class SyntheticCorpus(object):
+    """ A synthetic gold corpus built from template paragraphs, and submissions made from it """
+
+    def __init__(self, paragraphs, spans=1, overlap=0.0, fanout=0, seed=0, source=DATA_DIR):
+        rng = np.random.default_rng(seed)
+        names, frame = loadTsvDir(os.path.join(source, "tsv"))
+        frame = frame[RAW_COLUMNS]
+        self.texts = {}
+        for fn in names:
+            with open(os.path.join(source, "text", fn[:-4] + ".txt"), encoding="utf-8") as f:
+                self.texts[fn[:-4]] = f.read()
+        self.spans = spans
+
+        # Pick a template for each new paragraph and copy its rows
+        codes, templateIds = pd.factorize(frame["docId"])
+        starts = np.searchsorted(codes, np.arange(len(templateIds)))
+        counts = np.bincount(codes, minlength=len(templateIds))
+        picks = rng.integers(0, len(templateIds), paragraphs)
+        docIds = np.array([templateIds[t].split("-")[0] + "-" + str(i + 1) for i, t in enumerate(picks)], dtype=object)
+        rows = ranges(starts[picks], counts[picks])
+        gold = frame.iloc[rows].reset_index(drop=True)
+        gold["docId"] = np.repeat(docIds, counts[picks])
+        self.templates = dict(zip(docIds, templateIds[picks]))
+
+        # Each annotation set again in every copy of the paragraph text
+        if spans > 1:
+            stride = gold["annotSet"].max() + 1
+            shift = np.array([len(self.texts[self.templates[d]]) + 1 for d in gold["docId"]])
+            copies = []
+            for c in range(spans):
+                copy = gold.copy()
+                copy["annotSet"] += c * stride
+                copy["startOffset"] += c * shift
+                copy["endOffset"] += c * shift
+                copies.append(copy)
+            gold = pd.concat(copies, ignore_index=True)
+            gold = gold.iloc[np.argsort(pd.factorize(gold["docId"])[0], kind="stable")].reset_index(drop=True)
+
+        # Shifted copies of some annotation sets, overlapping the originals
+        if overlap > 0:
+            sets = gold[["docId", "annotSet"]].drop_duplicates()
+            chosen = sets[rng.random(len(sets)) < overlap]
+            dup = gold.merge(chosen, on=["docId", "annotSet"])
+            delta = rng.integers(1, 4, len(dup))
+            dup["annotSet"] += gold["annotSet"].max() + 1
+            dup["startOffset"] += delta
+            dup["endOffset"] += delta
+            gold = self.ordered(pd.concat([gold, self.clip(dup)], ignore_index=True), docIds)
+
+        # Extra Qualifiers on every Quantity, at the Quantity's own span
+        if fanout > 0:
+            quants = gold[gold["annotType"] == "Quantity"]
+            extra = quants.loc[quants.index.repeat(fanout)].copy()
+            extra["annotType"] = "Qualifier"
+            extra["other"] = ['{"Qualifies": "' + a + '"}' for a in extra["annotId"]]
+            # New ids are numbered on from the highest T id of their annotation set, so they never clash with one
+            numbers = gold["annotId"].str.extract(r"^T(\d+)", expand=False).astype(float).fillna(0)
+            highest = numbers.groupby([gold["docId"], gold["annotSet"]]).max().astype(int)
+            keys = pd.MultiIndex.from_frame(extra[["docId", "annotSet"]])
+            n = highest.reindex(keys).to_numpy() + extra.groupby(["docId", "annotSet"]).cumcount().to_numpy() + 1
+            extra["annotId"] = ["T" + str(j) + "-" + str(s) for j, s in zip(n, extra["annotSet"])]
+            gold = self.ordered(pd.concat([gold, extra], ignore_index=True), docIds)
+
+        self.docIds = list(docIds)
+        self.gold = gold
+
+    def ordered(self, frame, docIds):
+        """ Rows grouped by paragraph, in paragraph order, keeping their order within each """
+        rank = pd.Index(docIds).get_indexer(frame["docId"])
+        return frame.iloc[np.argsort(rank, kind="stable")].reset_index(drop=True)
+
+    def text(self, docId):
+        """ The full (repeated) text of a synthetic paragraph """
+        return " ".join([self.texts[self.templates[docId]]] * self.spans)
+
+    def clip(self, frame):
+        """ Keeps spans within their paragraph and sets their text to the paragraph text at their offsets """
+        frame = frame.copy()
+        lengths = np.array([len(self.texts[self.templates[d]]) for d in frame["docId"]])
+        total = (lengths + 1) * self.spans - 1
+        start = np.clip(frame["startOffset"].to_numpy(), 0, total)
+        end = np.clip(frame["endOffset"].to_numpy(), start, total)
+        frame["startOffset"] = start
+        frame["endOffset"] = end
+        texts = {}
+        values = []
+        for d, s, e in zip(frame["docId"], start, end):
+            if d not in texts:
+                texts[d] = self.text(d)
+            values.append(texts[d][s:e])
+        frame["text"] = values
+        return frame
+
+    def submission(self, miss=0.1, jitter=0.1, spurious=0.1, unitErrors=0.05, relErrors=0.05, seed=1):
+        """ A submission frame made from the synthetic gold with the given error rates """
+        rng = np.random.default_rng(seed)
+        gold = self.gold
+        sub = gold[rng.random(len(gold)) >= miss].copy()
+
+        # Boundary errors
+        moved = rng.random(len(sub)) < jitter
+        shifted = sub[moved].copy()
+        shifted["startOffset"] += rng.integers(-2, 3, len(shifted))
+        shifted["endOffset"] += rng.integers(-2, 3, len(shifted))
+        sub = pd.concat([sub[~moved], self.clip(shifted)]).sort_index()
+
+        # Spans where gold has none, as new annotation sets without relationships
+        extra = gold[rng.random(len(gold)) < spurious].copy()
+        lengths = extra["endOffset"] - extra["startOffset"]
+        room = np.array([len(self.text(d)) for d in extra["docId"]]) - lengths.to_numpy()
+        extra["startOffset"] = (rng.random(len(extra)) * np.maximum(room, 1)).astype(np.int64)
+        extra["endOffset"] = extra["startOffset"] + lengths
+        extra["annotSet"] += gold["annotSet"].max() + 1
+        extra.loc[extra["annotType"] != "Quantity", "other"] = np.nan
+        sub = pd.concat([sub, self.clip(extra)], ignore_index=True)
+
+        # Wrong units and relationships
+        units = sub["other"].str.contains('"unit"', regex=False, na=False).to_numpy()
+        wrongUnit = units & (rng.random(len(sub)) < unitErrors)
+        sub.loc[wrongUnit, "other"] = [json.dumps(dict(json.loads(o), unit="xyz")) for o in sub.loc[wrongUnit, "other"]]
+        rels = (sub["annotType"] != "Quantity").to_numpy() & sub["other"].notna().to_numpy()
+        wrongRel = rels & (rng.random(len(sub)) < relErrors)
+        sub.loc[wrongRel, "other"] = [json.dumps(dict((k, "T0-0") for k in json.loads(o))) for o in sub.loc[wrongRel, "other"]]
+
+        return self.ordered(sub, self.docIds)
+
+
+def writeTsvDir(frame, path):
+    """ Writes an annotation frame as one .tsv file per docId, the way the MeasEval data is laid out """
+    os.makedirs(path, exist_ok=True)
+    frame = frame[RAW_COLUMNS]
+    codes, docIds = pd.factorize(frame["docId"])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(docIds) + 1))
+    columns = [frame[col].to_numpy(dtype=object)[order] for col in RAW_COLUMNS]
+    # Missing values (an empty other) are written as empty fields
+    columns = [np.where(pd.isna(col), "", col) for col in columns]
+    rows = list(zip(*columns))
+    for i, docId in enumerate(docIds):
+        with open(os.path.join(path, docId + ".tsv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+            writer.writerow(RAW_COLUMNS)
+            writer.writerows(rows[bounds[i]:bounds[i + 1]])
@@ -0,0 +1,114 @@
+import os
+import re
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Token boundaries for the F1 (Overlap) score.
+# By default (the "spaces" tokenizer) a span's tokens are counted the way the CodaLab
+# scorer counts them: the spaces in its own text, plus one, so tabs and newlines don't
+# separate tokens and a span that only touches another still shares a token with it.
+# A TokenIndex tokenizes the paragraph texts in data/*/text instead, once, and keeps
+# the sorted start and end offsets of their tokens. The tokens a span covers are then
+# found by binary search on those offsets, for every matched pair at once.
+
+# Named tokenizers; any other tokenizer is taken as a regular expression matching one token
+TOKENIZERS = {
+    "whitespace": r"\S+",
+    "words": r"\w+|[^\w\s]",
+}
+
+
+# What paragraph text directories are called next to the .tsv ones (trial has txt)
+TEXT_DIRS = ["text", "txt"]
+
+
+def textDirFor(path):
+    """ The text directory next to a gold .tsv directory, e.g. data/eval/text for data/eval/tsv, or None if there is none """
+    # A packed gold file says nothing about where its texts are
+    if not os.path.isdir(path):
+        return None
+    for name in TEXT_DIRS:
+        textDir = os.path.join(os.path.dirname(os.path.normpath(path)), name)
+        if os.path.isdir(textDir):
+            return textDir
+    return None
+
+
+def compileTokenizer(tokenizer):
+    """ The pattern of a named tokenizer or of a regular expression, raising ValueError if it is neither """
+    try:
+        return re.compile(TOKENIZERS.get(tokenizer, tokenizer))
+    except re.error as err:
+        raise ValueError("Tokenizer {!r} is not a valid regular expression: {}".format(tokenizer, err))
+
+
+def readTexts(textDir):
+    """ The paragraph texts (docId.txt) in a directory, as a dict of docId: text """
+    texts = {}
+    for fn in os.listdir(textDir):
+        if fn.endswith(".txt"):
+            with open(os.path.join(textDir, fn), encoding="utf-8") as f:
+                texts[fn[:-4]] = f.read()
+    return texts
+
+
+class TokenIndex(object):
+    """ Start and end offsets of the tokens of every paragraph, for counting the tokens spans cover """
+
+    def __init__(self, docIds, bases, lengths, starts, ends, tokenizer):
+        # Paragraphs are laid end to end, each starting at its base, so the offsets of
+        # every paragraph are in one pair of sorted arrays
+        self.docIds = pd.Index(docIds)
+        self.bases = bases
+        self.lengths = lengths
+        self.starts = starts
+        self.ends = ends
+        self.tokenizer = tokenizer
+        h = hashlib.sha256(tokenizer.encode("utf-8"))
+        for array in (np.array(docIds, dtype=str), bases, lengths, starts, ends):
+            h.update(np.ascontiguousarray(array).tobytes())
+        self.digest = h.hexdigest()
+
+    @classmethod
+    def fromTexts(cls, texts, tokenizer="whitespace"):
+        """ Tokenizes a dict of docId: paragraph text """
+        pattern = compileTokenizer(tokenizer)
+        docIds = sorted(texts)
+        bases = np.zeros(len(docIds), dtype=np.int64)
+        lengths = np.array([len(texts[docId]) for docId in docIds], dtype=np.int64)
+        starts, ends = [], []
+        base = 0
+        for i, docId in enumerate(docIds):
+            bases[i] = base
+            for match in pattern.finditer(texts[docId]):
+                if match.end() > match.start():
+                    starts.append(base + match.start())
+                    ends.append(base + match.end())
+            base += len(texts[docId]) + 1
+        return cls(docIds, bases, lengths, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), tokenizer)
+
+    @classmethod
+    def fromDir(cls, textDir, tokenizer="whitespace"):
+        """ Tokenizes every paragraph text (docId.txt) in a directory """
+        return cls.fromTexts(readTexts(textDir), tokenizer)
+
+    def missing(self, docIds):
+        """ The docIds without a paragraph text, sorted """
+        docIds = pd.unique(np.asarray(docIds, dtype=object))
+        return sorted(docIds[self.docIds.get_indexer(docIds) < 0])
+
+    def count(self, docIds, starts, ends):
+        """ Number of tokens each span [start, end) of the given paragraphs overlaps """
+        docs = self.docIds.get_indexer(np.asarray(docIds, dtype=object))
+        if (docs < 0).any():
+            missing = sorted(set(np.asarray(docIds, dtype=object)[docs < 0]))
+            raise ValueError("No paragraph text for: " + ", ".join(map(str, missing[:10])) + (" ..." if len(missing) > 10 else ""))
+        # Spans are clipped to their paragraph, so they never reach into the next one
+        base, length = self.bases[docs], self.lengths[docs]
+        starts = base + np.clip(np.asarray(starts, dtype=np.int64), 0, length)
+        ends = base + np.clip(np.asarray(ends, dtype=np.int64), 0, length)
+        # Tokens starting before the end of the span, less those ending at or before its start
+        before = np.searchsorted(self.starts, ends, side="left")
+        after = np.searchsorted(self.ends, starts, side="right")
+        return np.where(ends > starts, np.maximum(before - after, 0), 0)
@@ -0,0 +1,340 @@
+import os
+import re
+import csv
+import glob
+import json
+import functools
+import unicodedata
+from fractions import Fraction
+
+# Unit canonicalization.
+# Units are compared as strings, so spelling variants of the same unit ("µm" and "μm",
+# "mg L−1" and "mg/L", "° C" and "°C") are scored as a false positive and a false
+# negative. Here each unit string is parsed into a canonical form: an exact scale and
+# the exponents of the SI base units it is made of (so "mg L−1", "mg/L", and "g/m3" are
+# all "1/1000 kg m-3"). Strings that aren't made of known units, such as "participants"
+# or "wt%", are canonical once their spelling is normalized.
+# Parsing is memoized, and the units found in data/*/tsv are parsed ahead of time into
+# unitTable.tsv (see buildUnitTable), so canonicalizing a submission is a lookup of its
+# distinct unit strings, whatever the number of rows they are on.
+
+UNITS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "unitTable.tsv")
+
+# Bump whenever a rule below changes, so tables built with the old rules are ignored
+RULES_VERSION = 2
+
+# The SI base units, plus degrees (of angle), degrees Celsius, and bits, in the order canonical forms list them
+BASES = ["kg", "m", "s", "A", "K", "mol", "cd", "deg", "degC", "bit"]
+
+
+def unit(scale, **dims):
+    """ A unit as its scale in base units and the exponent of each base unit """
+    return Fraction(scale), dict((base, exp) for base, exp in dims.items() if exp != 0)
+
+
+def scaled(u, factor):
+    """ A unit factor times as large """
+    return u[0] * factor, u[1]
+
+
+SECOND = unit(1, s=1)
+YEAR = unit(31557600, s=1)
+TONNE = unit(1000, kg=1)
+FOOT = unit(Fraction("0.3048"), m=1)
+POUND = unit(Fraction("0.45359237"), kg=1)
+JOULE = unit(1, kg=1, m=2, s=-2)
+WATT = unit(1, kg=1, m=2, s=-3)
+PASCAL = unit(1, kg=1, m=-1, s=-2)
+
+# Unit symbols, and whether SI prefixes may be put in front of them
+SYMBOLS = {
+    "m": (unit(1, m=1), True),
+    "g": (unit(Fraction(1, 1000), kg=1), True),
+    "s": (SECOND, True),
+    "A": (unit(1, A=1), True),
+    "K": (unit(1, K=1), True),
+    "mol": (unit(1, mol=1), True),
+    "cd": (unit(1, cd=1), True),
+    "Hz": (unit(1, s=-1), True),
+    "N": (unit(1, kg=1, m=1, s=-2), True),
+    "Pa": (PASCAL, True),
+    "J": (JOULE, True),
+    "W": (WATT, True),
+    "Wh": (unit(3600, kg=1, m=2, s=-2), True),
+    "C": (unit(1, A=1, s=1), True),
+    "V": (unit(1, kg=1, m=2, s=-3, A=-1), True),
+    "Ω": (unit(1, kg=1, m=2, s=-3, A=-2), True),
+    "T": (unit(1, kg=1, s=-2, A=-1), True),
+    "H": (unit(1, kg=1, m=2, s=-2, A=-2), True),
+    "eV": (unit(Fraction("1.602176634e-19"), kg=1, m=2, s=-2), True),
+    "L": (unit(Fraction(1, 1000), m=3), True),
+    "l": (unit(Fraction(1, 1000), m=3), True),
+    "M": (unit(1000, mol=1, m=-3), True),
+    "t": (TONNE, False),
+    "kt": (scaled(TONNE, 10 ** 3), False),
+    "Mt": (scaled(TONNE, 10 ** 6), False),
+    "Gt": (scaled(TONNE, 10 ** 9), False),
+    "Da": (unit(Fraction("1.66053906660e-27"), kg=1), True),
+    "bar": (unit(100000, kg=1, m=-1, s=-2), True),
+    "Torr": (unit(Fraction(101325, 760), kg=1, m=-1, s=-2), False),
+    "atm": (unit(101325, kg=1, m=-1, s=-2), False),
+    "Å": (unit(Fraction(1, 10 ** 10), m=1), False),
+    "AU": (unit(149597870700, m=1), False),
+    "ha": (unit(10000, m=2), False),
+    "min": (unit(60, s=1), False),
+    "h": (unit(3600, s=1), False),
+    "d": (unit(86400, s=1), False),
+    "week": (unit(604800, s=1), False),
+    "month": (unit(2629800, s=1), False),
+    "a": (YEAR, False),
+    "yr": (YEAR, False),
+    "ka": (scaled(YEAR, 10 ** 3), False),
+    "kyr": (scaled(YEAR, 10 ** 3), False),
+    "Ma": (scaled(YEAR, 10 ** 6), False),
+    "Myr": (scaled(YEAR, 10 ** 6), False),
+    "Ga": (scaled(YEAR, 10 ** 9), False),
+    "Gyr": (scaled(YEAR, 10 ** 9), False),
+    "rpm": (unit(Fraction(1, 60), s=-1), False),
+    "°": (unit(1, deg=1), False),
+    "deg": (unit(1, deg=1), True),
+    "°C": (unit(1, degC=1), False),
+    "bit": (unit(1, bit=1), True),
+    "bps": (unit(1, bit=1, s=-1), True),
+    "%": (unit(Fraction(1, 100)), False),
+    "‰": (unit(Fraction(1, 1000)), False),
+    "ppm": (unit(Fraction(1, 10 ** 6)), False),
+    "ppb": (unit(Fraction(1, 10 ** 9)), False),
+    # Imperial and US units, so "ft" isn't read as a prefixed unit
+    "in": (scaled(FOOT, Fraction(1, 12)), False),
+    "ft": (FOOT, False),
+    "yd": (scaled(FOOT, 3), False),
+    "mi": (scaled(FOOT, 5280), False),
+    "lb": (POUND, False),
+    "oz": (scaled(POUND, Fraction(1, 16)), False),
+    "gal": (unit(Fraction("0.003785411784"), m=3), False),
+    "psi": (unit(Fraction("4.4482216152605") / Fraction("0.0254") ** 2, kg=1, m=-1, s=-2), False),
+}
+
+# Spelled out units and other names of the symbols above, matched ignoring case
+WORDS = {
+    "sec": "s", "second": "s", "seconds": "s",
+    "mins": "min", "minute": "min", "minutes": "min",
+    "hr": "h", "hrs": "h", "hour": "h", "hours": "h",
+    "day": "d", "days": "d",
+    "wk": "week", "wks": "week", "weeks": "week",
+    "months": "month",
+    "y": "yr", "yrs": "yr", "year": "yr", "years": "yr",
+    "metre": "m", "metres": "m", "meter": "m", "meters": "m",
+    "gram": "g", "grams": "g",
+    "litre": "L", "litres": "L", "liter": "L", "liters": "L",
+    "tonne": "t", "tonnes": "t",
+    "dalton": "Da", "daltons": "Da",
+    "kelvin": "K",
+    "bar": "bar", "torr": "Torr", "atm": "atm",
+    "ohm": "Ω", "ohms": "Ω",
+    "degree": "°", "degrees": "°", "deg": "deg",
+    "percent": "%",
+    "inch": "in", "inches": "in", "foot": "ft", "feet": "ft", "yard": "yd", "yards": "yd",
+    "mile": "mi", "miles": "mi", "lbs": "lb", "pound": "lb", "pounds": "lb", "ounce": "oz", "ounces": "oz",
+    "gallon": "gal", "gallons": "gal",
+}
+
+# SI prefixes, and their spelled out names (for words like "centimeters").
+# Years and tonnes don't take them (that would make "ft" a femtotonne and "da" a
+# tenth of a year); their usual multiples are symbols of their own instead.
+PREFIXES = {
+    "P": 10 ** 15, "T": 10 ** 12, "G": 10 ** 9, "M": 10 ** 6, "k": 10 ** 3, "h": 10 ** 2,
+    "d": Fraction(1, 10), "c": Fraction(1, 10 ** 2), "m": Fraction(1, 10 ** 3), "μ": Fraction(1, 10 ** 6),
+    "u": Fraction(1, 10 ** 6), "n": Fraction(1, 10 ** 9), "p": Fraction(1, 10 ** 12), "f": Fraction(1, 10 ** 15),
+}
+WORD_PREFIXES = {
+    "giga": 10 ** 9, "mega": 10 ** 6, "kilo": 10 ** 3, "centi": Fraction(1, 10 ** 2),
+    "milli": Fraction(1, 10 ** 3), "micro": Fraction(1, 10 ** 6), "nano": Fraction(1, 10 ** 9),
+}
+# Billions of years, as written in planetary science
+MULTIPLES = {"byr": 10 ** 9, "b.y.": 10 ** 9}
+
+# Strings that would parse as units but mean something else (°N is north, not degree
+# newtons, and da is no day year)
+NOT_UNITS = {"pH", "da", "das", "°N", "°S", "°E", "°W"}
+
+# Whole strings that are other spellings of the same (non SI) unit, matched ignoring case
+ALIASES = {
+    "per cent": "%",
+    "wt.%": "wt%", "wt. %": "wt%", "wt %": "wt%", "weight%": "wt%", "weight %": "wt%",
+    "vol.%": "vol%", "vol. %": "vol%", "vol %": "vol%", "volume%": "vol%",
+    "on": "°N", "os": "°S",
+    "degc": "°C", "deg c": "°C", "degrees c": "°C", "degrees celsius": "°C", "celsius": "°C",
+}
+
+MINUS = re.compile("[−–‒‐‑﹣－]")
+SPACES = re.compile(r"\s+")
+SIGN_SPACE = re.compile(r"([-+])\s+(?=\d)")
+DEGREE_SPACE = re.compile(r"°\s+(?=[CFKNSEW]\b)")
+FACTOR = re.compile(r"([^\d^+\-]+?)\^?([+-]?\d+)?\Z")
+NUMBER = re.compile(r"(\d+(?:\.\d+)?)(?:\^([+-]?\d+))?\Z")
+
+
+def normalizeUnit(text):
+    """ A unit string with its unicode forms, minus signs, and spaces normalized """
+    # NFKC turns the micro sign into mu, superscript digits into digits, and the angstrom sign into Å
+    text = unicodedata.normalize("NFKC", text)
+    text = MINUS.sub("-", text)
+    text = SPACES.sub(" ", text).strip()
+    text = SIGN_SPACE.sub(r"\1", text)
+    return DEGREE_SPACE.sub("°", text)
+
+
+def lookupSymbol(symbol, words=True):
+    """ The unit a symbol (or, with words, a spelled out unit) stands for, or None """
+    if symbol in NOT_UNITS:
+        return None
+    if symbol in SYMBOLS:
+        return SYMBOLS[symbol][0]
+    if not words:
+        for prefix, factor in PREFIXES.items():
+            rest = symbol[len(prefix):]
+            if symbol.startswith(prefix) and rest in SYMBOLS and SYMBOLS[rest][1]:
+                scale, dims = SYMBOLS[rest][0]
+                return scale * factor, dims
+        return None
+    if symbol.lower() in WORDS:
+        return SYMBOLS[WORDS[symbol.lower()]][0]
+    if symbol.lower() in MULTIPLES:
+        scale, dims = YEAR
+        return scale * MULTIPLES[symbol.lower()], dims
+    for prefix, factor in PREFIXES.items():
+        rest = symbol[len(prefix):]
+        if symbol.startswith(prefix) and rest:
+            name = rest if rest in SYMBOLS else WORDS.get(rest.lower()) if len(rest) > 2 else None
+            if name is not None and SYMBOLS[name][1]:
+                scale, dims = SYMBOLS[name][0]
+                return scale * factor, dims
+    for prefix, factor in WORD_PREFIXES.items():
+        rest = symbol[len(prefix):].lower()
+        if symbol.lower().startswith(prefix) and rest in WORDS and SYMBOLS[WORDS[rest]][1]:
+            scale, dims = SYMBOLS[WORDS[rest]][0]
+            return scale * factor, dims
+    return None
+
+
+def factorUnits(symbol):
+    """ The units the symbol of one factor stands for: one, two written together (kgs for kg s), or None """
+    found = lookupSymbol(symbol)
+    if found is not None or symbol in NOT_UNITS:
+        return None if found is None else [found]
+    for i in range(1, len(symbol)):
+        first, second = lookupSymbol(symbol[:i], False), lookupSymbol(symbol[i:], False)
+        if first is not None and second is not None:
+            return [first, second]
+    return None
+
+
+def parseUnit(text):
+    """ The scale and base unit exponents of a normalized unit string, or None if it isn't made of known units """
+    # Everything after a "/" (or "per") is in the denominator, so W/m K is W m-1 K-1
+    tokens = text.replace("/", " / ").replace("·", " ").replace("⋅", " ").replace("*", " ").split()
+    scale, dims = Fraction(1), {}
+    sign = 1
+    factors = 0
+    for token in tokens:
+        if token == "/" or token.lower() == "per":
+            sign = -1
+            continue
+        # Numbers scale the unit, e.g. the 1 of 1/s or the 100 of mg/100 g
+        number = NUMBER.match(token)
+        if number:
+            value = Fraction(number.group(1)) ** int(number.group(2) or 1)
+            if value == 0:
+                return None
+            scale *= value ** sign
+            continue
+        match = FACTOR.match(token)
+        found = factorUnits(match.group(1)) if match else None
+        if found is None:
+            return None
+        # The exponent belongs to the last of the units written together
+        exps = [sign] * (len(found) - 1) + [sign * int(match.group(2) or 1)]
+        for (factor, factorDims), exp in zip(found, exps):
+            scale *= factor ** exp
+            for base, e in factorDims.items():
+                dims[base] = dims.get(base, 0) + e * exp
+        factors += 1
+    if factors == 0:
+        return None
+    return scale, dict((base, e) for base, e in dims.items() if e != 0)
+
+
+def formatUnit(scale, dims):
+    """ The canonical string of a parsed unit: its scale, then each base unit with its exponent """
+    parts = [str(scale)]
+    for base in BASES:
+        if base in dims:
+            parts.append(base if dims[base] == 1 else base + str(dims[base]))
+    return " ".join(parts)
+
+
+@functools.lru_cache(maxsize=65536)
+def canonicalUnit(text):
+    """ The canonical form of a unit string """
+    text = normalizeUnit(text)
+    text = ALIASES.get(text.lower(), text)
+    parsed = parseUnit(text)
+    return formatUnit(*parsed) if parsed is not None else text
+
+
+@functools.lru_cache(maxsize=None)
+def readUnitTable(path=UNITS_FILE):
+    """ The precompiled unit: canonical form table at path, or an empty one if it is missing or was built with other rules """
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f, delimiter="\t"))
+    if not rows or rows[0] != ["#version", str(RULES_VERSION)]:
+        return {}
+    return dict((row[0], row[1]) for row in rows[2:])
+
+
+def writeUnitTable(units, path=UNITS_FILE):
+    """ Writes the canonical form of every unit string to path """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(["#version", str(RULES_VERSION)])
+        writer.writerow(["unit", "canonical"])
+        for u in sorted(set(units)):
+            writer.writerow([u, canonicalUnit(u)])
+    readUnitTable.cache_clear()
+
+
+def buildUnitTable(dataDir, path=UNITS_FILE):
+    """ Writes the canonical form of every unit in the .tsv files of each data/*/tsv directory, returning how many there are """
+    from .validation import readRaw
+    units = set()
+    for fn in glob.glob(os.path.join(dataDir, "*", "tsv", "*.tsv")):
+        header, rows, _ = readRaw(fn)
+        if not header or "other" not in header:
+            continue
+        col = header.index("other")
+        for row in rows:
+            if len(row) > col and '"unit"' in row[col]:
+                try:
+                    data = json.loads(row[col])
+                except ValueError:
+                    continue
+                if isinstance(data, dict) and isinstance(data.get("unit"), str) and data["unit"] != "":
+                    units.add(data["unit"])
+    writeUnitTable(units, path)
+    return len(units)
+
+
+def canonicalUnits(values, path=UNITS_FILE):
+    """ The canonical form of each unit in an array, looking up each distinct unit once """
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    table = readUnitTable(path)
+    keys = np.empty(len(uniques) + 1, dtype=object)
+    keys[:-1] = [table[u] if u in table else canonicalUnit(str(u)) for u in uniques]
+    # Missing units (code -1) stay missing
+    keys[-1] = None
+    return keys[codes]
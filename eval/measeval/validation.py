@@ -0,0 +1,253 @@
+import os
+import re
+import csv
+import json
+from collections import namedtuple
+
+# Submission .tsv files are validated on ingest.
+# Each file is read once, as raw strings, and every rule is checked in one pass over
+# the rows of all the files a worker reads at once, each distinct value only once:
+# - docId is unique together with annotSet and annotId
+# - annotId matches T?\d*-?\d+
+# - annotType is one of the four annotation types
+# - annotSet, startOffset, and endOffset are integers
+# - the length of text equals endOffset - startOffset
+# - other is empty or valid json, with keys (and mods) that are allowed for the annotType
+# The same parse then gives the typed frame used for scoring, so submissions
+# aren't read a second time. These are the rules the vladiate validators used to check.
+# Checking needs nothing beyond the standard library: pandas (and numpy) are only
+# imported once a typed frame is asked for, so validating alone starts fast.
+
+COLUMNS = ["docId", "annotSet", "annotType", "startOffset", "endOffset", "annotId", "text", "other"]
+INT_COLUMNS = ["annotSet", "startOffset", "endOffset"]
+ANNOT_ID = re.compile(r"(?:T?\d*-?\d+)\Z")
+TYPES = ["Quantity", "Qualifier", "MeasuredProperty", "MeasuredEntity"]
+
+OTHER_KEYS = ["HasQuantity", "HasProperty", "Qualifies", "mods", "unit"]
+TYPE_KEYS = {
+    "Quantity": ["mods", "unit"],
+    "MeasuredEntity": ["HasProperty", "HasQuantity"],
+    "MeasuredProperty": ["HasQuantity"],
+    "Qualifier": ["Qualifies"],
+}
+MODIFIERS = ['IsCount', 'IsApproximate', 'IsMeanHasTolerance', 'IsMedian',
+             'IsList', 'IsRangeHasTolerance', 'IsMean', 'IsRange',
+             'HasTolerance', 'IsMeanIsRange', 'IsMeanHasSD']
+
+# The strings pd.read_csv reads as missing by default; the typed frame treats them the same way
+NA_STRINGS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+              '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# One failed check: line is the line number in the file (the header is line 1),
+# or None for problems with the file as a whole.
+ValidationError = namedtuple("ValidationError", ["file", "line", "field", "check", "value", "message"])
+
+
+def toInt(value):
+    """ The value as an int, or None if it isn't one """
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def checkOther(other, annotType):
+    """ The problem with an other field for the given annotType, or None if it is fine """
+    try:
+        data = json.loads(other)
+    except json.decoder.JSONDecodeError:
+        return "'{}' is not valid json".format(other)
+    if not isinstance(data, dict):
+        return "'{}' is not a json object".format(other)
+    if not all(k in OTHER_KEYS for k in data.keys()):
+        return "'{}' has invalid key".format(other)
+    if annotType in TYPE_KEYS and not all(k in TYPE_KEYS[annotType] for k in data.keys()):
+        return "'{}' has invalid key".format(other)
+    if annotType == "Quantity" and "mods" in data.keys():
+        if type(data["mods"]) != list:
+            return "'{}' mods field is not a list".format(other)
+        if not all(k in MODIFIERS for k in data["mods"]):
+            return "'{}' has invalid key in mods".format(other)
+    return None
+
+
+def readRaw(path):
+    """ The header and rows of one .tsv file as strings, with the line each row starts on """
+    with open(path, newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, None)
+        rows = []
+        lines = []
+        line = reader.line_num
+        for row in reader:
+            if row:
+                rows.append(row)
+                lines.append(line + 1)
+            line = reader.line_num
+    return header, rows, lines
+
+
+def checkColumns(columns):
+    """ Every rule violation in the raw (all string) columns of submission rows, with their file and line """
+    errors = []
+    seen = set()
+    idOk = {}
+    ints = {}
+    problems = {}
+    typeMessage = "'{}' is not one of " + ", ".join(TYPES)
+    idMessage = "'{}' does not match pattern /" + ANNOT_ID.pattern + "/"
+
+    rows = zip(columns["file"], columns["line"], *[columns[col] for col in COLUMNS])
+    for fn, line, docId, annotSet, annotType, startOffset, endOffset, annotId, text, other in rows:
+        key = (fn, docId, annotSet, annotId)
+        if key in seen:
+            errors.append(ValidationError(fn, line, "docId", "unique", (docId, annotSet, annotId),
+                                          "'{}' is already in the column (unique with: {})".format(docId, (annotSet, annotId))))
+        seen.add(key)
+
+        if annotId not in idOk:
+            idOk[annotId] = ANNOT_ID.match(annotId) is not None
+        if not idOk[annotId]:
+            errors.append(ValidationError(fn, line, "annotId", "regex", annotId, idMessage.format(annotId)))
+
+        if annotType not in TYPES and annotType != "":
+            errors.append(ValidationError(fn, line, "annotType", "set", annotType, typeMessage.format(annotType)))
+
+        # Each distinct value is only parsed once
+        for value in (annotSet, startOffset, endOffset):
+            if value not in ints:
+                ints[value] = toInt(value)
+        start, end = ints[startOffset], ints[endOffset]
+        if ints[annotSet] is None or start is None or end is None:
+            for col, value in zip(INT_COLUMNS, (annotSet, startOffset, endOffset)):
+                if ints[value] is None:
+                    errors.append(ValidationError(fn, line, col, "int", value, "invalid literal for int() with base 10: '{}'".format(value)))
+
+        # Length can only be checked where both offsets are integers
+        if start is not None and end is not None and len(text) != end - start:
+            errors.append(ValidationError(fn, line, "text", "length", text,
+                                          "'{}' length {} does not match expected length /{}/".format(text, len(text), end - start)))
+
+        # Each distinct (other, annotType) pair is only decoded once
+        if other != "":
+            if (other, annotType) not in problems:
+                problems[(other, annotType)] = checkOther(other, annotType)
+            if problems[(other, annotType)] is not None:
+                errors.append(ValidationError(fn, line, "other", "json", other, problems[(other, annotType)]))
+
+    return errors
+
+
+def typedFrame(raw):
+    """ The annotation frame pd.read_csv would have read from the same files, from valid raw rows """
+    import numpy as np
+    df = raw[COLUMNS].copy()
+    for col in INT_COLUMNS:
+        df[col] = df[col].map(int).astype(np.int64)
+    for col in ["docId", "annotType", "annotId", "text", "other"]:
+        df[col] = df[col].where(~df[col].isin(NA_STRINGS))
+    return df.infer_objects().reset_index(drop=True)
+
+
+def validateFiles(paths, frames=True):
+    """ Reads and checks a list of .tsv files, returning their errors, their row counts, and the typed frame of the valid ones (None without frames) """
+    errors = []
+    counts = []
+    columns = dict((col, []) for col in COLUMNS + ["file", "line"])
+    for path in paths:
+        fn = os.path.basename(path)
+        header, rows, lines = readRaw(path)
+        counts.append(len(rows))
+        if not header:
+            errors.append(ValidationError(fn, None, None, "header", None, "Source file has no field names"))
+            continue
+        extra = [c for c in header if c not in COLUMNS]
+        missing = [c for c in COLUMNS if c not in header]
+        if extra or missing:
+            errors.append(ValidationError(fn, 1, None, "header", None, "Unexpected fields: {}; missing fields: {}".format(extra, missing)))
+            continue
+        # Rows with the wrong number of fields can't be checked any further
+        width = len(header)
+        for row, line in zip(rows, lines):
+            if len(row) != width:
+                errors.append(ValidationError(fn, line, None, "fields", None, "Expected {} fields, got {}".format(width, len(row))))
+        rows, lines = [r for r in rows if len(r) == width], [l for r, l in zip(rows, lines) if len(r) == width]
+        for i, col in enumerate(header):
+            columns[col].extend(r[i] for r in rows)
+        columns["file"].extend([fn] * len(rows))
+        columns["line"].extend(lines)
+
+    errors += checkColumns(columns)
+    bad = set(err.file for err in errors)
+    order = dict((os.path.basename(path), i) for i, path in enumerate(paths))
+    errors.sort(key=lambda err: (order[err.file], err.line or 0))
+    if not frames:
+        return errors, counts, None
+    import pandas as pd
+    raw = pd.DataFrame(columns, dtype=object)
+    return errors, counts, typedFrame(raw[~raw["file"].isin(bad)])
+
+
+class ValidationReport(object):
+    """ The outcome of validating a submission directory: every error found, and the parsed rows of the valid files """
+
+    def __init__(self, names, results):
+        self.names = names
+        self.errors = [err for errors, _, _ in results for err in errors]
+        self.rows = dict(zip(names, [count for _, counts, _ in results for count in counts]))
+        self.frames = [df for _, _, df in results]
+
+    @property
+    def badfiles(self):
+        """ Names of files that failed validation, in directory order """
+        bad = set(err.file for err in self.errors)
+        return [name for name in self.names if name in bad]
+
+    def frame(self):
+        """ The valid files as one annotation frame with the other column decoded, as loadTsvDir would give """
+        import pandas as pd
+        from .corpus import decodeOther
+        if any(df is None for df in self.frames):
+            raise ValueError("Submission was validated without frames")
+        return decodeOther(pd.concat(self.frames, ignore_index=True))
+
+    def toDict(self):
+        """ The report as plain data, e.g. for json.dump """
+        return {"files": len(self.names), "badfiles": self.badfiles, "errors": [err._asdict() for err in self.errors]}
+
+    def printErrors(self, shown=99):
+        """ Prints a summary of failed checks per file and field """
+        for name in self.badfiles:
+            print("Failed: " + name)
+            groups = {}
+            for err in self.errors:
+                if err.file == name:
+                    groups.setdefault((err.field, err.check), []).append(err)
+            for (field, check), errs in groups.items():
+                if field is None:
+                    for err in errs:
+                        print("  " + err.message)
+                    continue
+                print("  {} check failed {} time(s) ({:.1%}) on field: '{}'".format(check, len(errs), len(errs) / self.rows[name], field))
+                invalid = list(dict.fromkeys(err.value for err in errs))
+                print("    Invalid fields: [{}]".format(", ".join("'{}'".format(v) for v in invalid[:shown])))
+                if len(invalid) > shown:
+                    print("    ({} more suppressed)".format(len(invalid) - shown))
+
+
+def validateDir(path, skip=[], jobs=1, frames=True):
+    """ Validates every .tsv file in a submission directory, in up to jobs worker processes; frames=False only checks them """
+    names = [fn for fn in os.listdir(path) if fn not in skip and fn.endswith(".tsv")]
+    paths = [os.path.join(path, fn) for fn in names]
+    if jobs > 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        # Contiguous chunks keep the rows in directory order, sized as np.array_split would
+        n = min(jobs, len(paths))
+        size, extra = divmod(len(paths), n)
+        bounds = [i * size + min(i, extra) for i in range(n + 1)]
+        chunks = [paths[bounds[i]:bounds[i + 1]] for i in range(n)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(validateFiles, chunks, [frames] * len(chunks)))
+    else:
+        results = [validateFiles(paths, frames)]
+    return ValidationReport(names, results)
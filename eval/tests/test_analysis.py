@@ -0,0 +1,15 @@
+import os
+
+from measeval import GoldCorpus, score
+from measeval.validation import validateDir
+
+EVAL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "eval", "tsv")
+
+
+def test_every_submission_row_has_its_annotation_set():
+    gold = GoldCorpus(EVAL_DIR)
+    details = score(gold, validateDir(EVAL_DIR).frame(), modes=["overall"], details=True)["details"]
+    subRows = details[details["matchType"] != "Gold only"]
+    # Unit and modifier rows are keyed on the submission set as much as the span rows are
+    for annotType in ["Quantity", "Unit", "modifier"]:
+        assert subRows.loc[subRows["type"] == annotType, "annotSet"].notna().all()
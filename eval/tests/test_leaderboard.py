@@ -0,0 +1,10 @@
+from measeval.leaderboard import expandRuns, scoreRun
+
+
+def test_missing_paths_are_kept(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "notes.txt").write_text("")
+    indir = str(tmp_path) + "/"
+    assert expandRuns(["*", "missing", "a"], indir) == [indir + "a", indir + "b", indir + "missing"]
+    assert scoreRun("missing", indir + "missing")["status"] == "error: no such directory"
@@ -0,0 +1,18 @@
+import numpy as np
+
+from measeval.matching import oneToOne
+
+
+def test_heaviest_pairs_are_kept():
+    keep = oneToOne(["d"] * 3, [0, 0, 1], [0, 1, 1], [0.9, 0.5, 0.8])
+    assert keep.tolist() == [True, False, True]
+
+
+def test_zero_weight_pairs_are_kept_when_free():
+    # Spans overlapping in characters but sharing no token still pair up
+    keep = oneToOne(["d"] * 3, [0, 0, 1], [0, 1, 1], [0.5, 0.3, 0.0])
+    assert keep.tolist() == [True, False, True]
+    keep = oneToOne(["d"] * 4, [0, 1, 1, 2], [0, 0, 1, 2], [0.5, 0.4, 0.0, 0.0])
+    assert keep.tolist() == [True, False, True, True]
+    keep = oneToOne(["d", "d", "e"], [0, 1, 0], [0, 0, 0], np.zeros(3))
+    assert keep.sum() == 2 and keep[2]
@@ -0,0 +1,13 @@
+import os
+
+from measeval.synthetic import SyntheticCorpus, writeTsvDir
+from measeval.validation import validateDir
+
+
+def test_fanout_corpus_validates(tmp_path):
+    # Enough paragraphs to reach train sets whose own ids run past T90
+    corpus = SyntheticCorpus(300, spans=2, overlap=0.2, fanout=2)
+    for name, frame in [("gold", corpus.gold), ("sub", corpus.submission())]:
+        path = os.path.join(str(tmp_path), name)
+        writeTsvDir(frame, path)
+        assert validateDir(path).badfiles == []
@@ -0,0 +1,25 @@
+import pytest
+
+from measeval.tokens import TokenIndex, compileTokenizer, textDirFor
+
+
+def test_invalid_tokenizer_is_a_value_error():
+    with pytest.raises(ValueError):
+        compileTokenizer("(")
+    assert compileTokenizer("whitespace").pattern == r"\S+"
+
+
+def test_text_dir_next_to_gold(tmp_path):
+    (tmp_path / "tsv").mkdir()
+    (tmp_path / "txt").mkdir()
+    assert textDirFor(str(tmp_path / "tsv")) == str(tmp_path / "txt")
+    (tmp_path / "text").mkdir()
+    assert textDirFor(str(tmp_path / "tsv") + "/") == str(tmp_path / "text")
+    # A packed gold file has no text directory of its own
+    (tmp_path / "gold.pack").write_bytes(b"")
+    assert textDirFor(str(tmp_path / "gold.pack")) is None
+
+
+def test_missing_paragraphs():
+    index = TokenIndex.fromTexts({"a": "one two", "b": "three"}, "whitespace")
+    assert index.missing(["a", "c", "b", "c"]) == ["c"]
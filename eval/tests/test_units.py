@@ -0,0 +1,32 @@
+from measeval.units import canonicalUnit
+
+
+def test_imperial_symbols_are_not_prefixed_units():
+    assert canonicalUnit("ft") != canonicalUnit("ng")
+    assert canonicalUnit("ft") == canonicalUnit("feet") == canonicalUnit("12 in")
+    assert canonicalUnit("lbs") == canonicalUnit("lb")
+
+
+def test_years_and_tonnes_take_no_prefixes():
+    # da and ca are not a tenth or a hundredth of a year
+    assert canonicalUnit("da") == "da"
+    assert canonicalUnit("ca") == "ca"
+
+
+def test_year_and_tonne_multiples():
+    assert canonicalUnit("Ma") == canonicalUnit("Myr")
+    assert canonicalUnit("ka") == canonicalUnit("1000 yr")
+    assert canonicalUnit("Mt") == canonicalUnit("1000000 t")
+    assert canonicalUnit("Mt/yr") == canonicalUnit("Mt yr-1")
+
+
+def test_numeric_factors():
+    assert canonicalUnit("1/s") == canonicalUnit("s-1") == canonicalUnit("Hz")
+    assert canonicalUnit("mg/100 g") == canonicalUnit("10 ppm")
+    assert canonicalUnit("0/s") == "0/s"
+
+
+def test_variants_still_match():
+    assert canonicalUnit("mg L−1") == canonicalUnit("mg/L") == canonicalUnit("g/m3")
+    assert canonicalUnit("kgs-1") == canonicalUnit("kg/s")
+    assert canonicalUnit("°N") == "°N"